@@ -0,0 +1,213 @@
+"""
+Benchmarks the download path offline against the local stand-in API (fake_chub.py).
+
+Starts the fake server in its own process, then runs each scenario in a fresh process,
+so the peak RSS belongs to that scenario alone:
+
+- single: downloads --repeat cards one after another with download_card_pipeline
+- bulk: downloads --cards cards through the DownloadEngine
+
+For each scenario it reports cards/sec, p50/p95 per-card latency, peak RSS and the bytes
+written to the output directory. --json saves the results for comparing runs.
+
+    python benchmarks/download_benchmark.py --cards 100 --gallery-images 30 --latency 20
+    python benchmarks/download_benchmark.py --set gallery_workers=16 --json after.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Root of the repository, so the benchmark works from any working directory
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(benchmark_directory)
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of values, or None for no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, round(fraction * len(ordered) + 0.5))
+    return ordered[min(len(ordered), rank) - 1]
+
+def get_peak_rss():
+    """
+    Returns this process's peak resident set size in bytes, or None where it can't be read.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def get_directory_size(path):
+    """
+    Returns the total size of the files under path, counting hardlinked files once.
+    """
+    total = 0
+    seen = set()
+    for folder, _, file_names in os.walk(path):
+        for file_name in file_names:
+            stat = os.stat(os.path.join(folder, file_name))
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+def run_scenario(args):
+    """
+    Runs one scenario in this process and returns its measurements.
+    """
+    sys.path.insert(0, repo_root)
+    from chub_downloader import DownloadEngine, config, download_card_pipeline
+    from chub_downloader.metrics import add_listener
+    from chub_downloader.network import format_request_stats
+
+    config['Settings']['api_base_url'] = args.api_url
+    for setting in args.set:
+        key, _, value = setting.partition('=')
+        config['Settings'][key.strip()] = value.strip()
+    full_paths = [f"bench-creator-{index % 20}/bench-card-{index}" for index in range(args.cards)]
+
+    # Per-card latency from the metrics events: the search plus the download itself
+    latencies = {}
+    statuses = {}
+    def on_event(event):
+        if event['event'] == 'stage' and event['stage'] == 'search':
+            latencies[event['card']] = latencies.get(event['card'], 0) + event['seconds']
+        elif event['event'] == 'done':
+            latencies[event['card']] = latencies.get(event['card'], 0) + event['seconds']
+            statuses[event['card']] = event['status']
+    add_listener(on_event)
+
+    with tempfile.TemporaryDirectory() as output_directory:
+        start_time = time.perf_counter()
+        if args.worker == 'single':
+            full_paths = full_paths[:args.repeat]
+            for full_path in full_paths:
+                try:
+                    download_card_pipeline(full_path, output_directory, args.bundle, '')
+                except Exception as err:
+                    statuses[full_path] = f"failed: {err}"
+        else:
+            import asyncio
+
+            async def download_all():
+                engine = DownloadEngine(output_directory, args.bundle, '',
+                                        search_concurrency=args.search_concurrency,
+                                        download_concurrency=args.download_concurrency)
+                async for full_path, result, _ in engine.run(full_paths):
+                    if result['status'] == 'failed':
+                        statuses[full_path] = 'failed'
+            asyncio.run(download_all())
+        elapsed = time.perf_counter() - start_time
+        bytes_written = get_directory_size(output_directory)
+
+    card_latencies = [latencies[full_path] for full_path in full_paths if full_path in latencies]
+    return {
+        'scenario': args.worker,
+        'cards': len(full_paths),
+        'failed': sum(1 for status in statuses.values() if status.startswith('failed')),
+        'seconds': round(elapsed, 3),
+        'cards_per_second': round(len(full_paths) / elapsed, 3) if elapsed else None,
+        'p50_seconds': percentile(card_latencies, 0.50),
+        'p95_seconds': percentile(card_latencies, 0.95),
+        'peak_rss_bytes': get_peak_rss(),
+        'bytes_written': bytes_written,
+        'requests': format_request_stats(),
+    }
+
+def start_server(args):
+    """
+    Starts fake_chub.py in its own process and returns the process and its base URL.
+    """
+    command = [
+        sys.executable, os.path.join(benchmark_directory, 'fake_chub.py'), '--port', '0',
+        '--cards', str(args.cards), '--gallery-images', str(args.gallery_images),
+        '--versions', str(args.versions), '--card-size', str(args.card_size), '--image-size', str(args.image_size),
+        '--latency', str(args.latency), '--jitter', str(args.jitter),
+        '--error-rate', str(args.error_rate), '--throttle-rate', str(args.throttle_rate),
+        '--seed', str(args.seed),
+    ]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    base_url = server.stdout.readline().strip()
+    if not base_url:
+        server.kill()
+        raise RuntimeError("The fake server didn't start")
+    return server, base_url
+
+def format_bytes(value):
+    if value is None:
+        return 'n/a'
+    return f"{value / 1024 / 1024:.1f} MiB"
+
+def format_seconds(value):
+    return 'n/a' if value is None else f"{value * 1000:.0f} ms"
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the downloader against a local fake Chub API.")
+    parser.add_argument('--scenario', choices=['single', 'bulk', 'all'], default='all')
+    parser.add_argument('--cards', type=int, default=50, help="Cards downloaded by the bulk scenario.")
+    parser.add_argument('--repeat', type=int, default=5, help="Cards downloaded one by one by the single scenario.")
+    parser.add_argument('--bundle', choices=['Folder', 'Zip'], default='Folder')
+    parser.add_argument('--search-concurrency', type=int, default=4)
+    parser.add_argument('--download-concurrency', type=int, default=4)
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="Override a config.ini setting, e.g. gallery_workers=16 (can be repeated).")
+    parser.add_argument('--gallery-images', type=int, default=30)
+    parser.add_argument('--versions', type=int, default=1, help="Versions per card (with --set download_versions=yes).")
+    parser.add_argument('--card-size', type=int, default=200 * 1024)
+    parser.add_argument('--image-size', type=int, default=150 * 1024)
+    parser.add_argument('--latency', type=float, default=0, help="Server latency in milliseconds.")
+    parser.add_argument('--jitter', type=float, default=0, help="Extra random server latency in milliseconds.")
+    parser.add_argument('--error-rate', type=float, default=0, help="Fraction of 503 responses.")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="Fraction of 429 responses.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='FILE', help="Also write the results to FILE.")
+    # Used when the harness runs a scenario in a child process
+    parser.add_argument('--worker', choices=['single', 'bulk'], help=argparse.SUPPRESS)
+    parser.add_argument('--api-url', help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.worker:
+        print(json.dumps(run_scenario(args)))
+        return 0
+
+    scenarios = ['single', 'bulk'] if args.scenario == 'all' else [args.scenario]
+    server, base_url = start_server(args)
+    results = []
+    try:
+        for scenario in scenarios:
+            command = [sys.executable, os.path.abspath(__file__), '--worker', scenario, '--api-url', base_url]
+            command += (argv if argv is not None else sys.argv[1:])
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        server.terminate()
+        server.wait()
+
+    for result in results:
+        print(f"{result['scenario']}: {result['cards']} cards in {result['seconds']:.2f} s, "
+              f"{result['cards_per_second']:.2f} cards/s, "
+              f"p50 {format_seconds(result['p50_seconds'])}, p95 {format_seconds(result['p95_seconds'])}, "
+              f"peak RSS {format_bytes(result['peak_rss_bytes'])}, written {format_bytes(result['bytes_written'])}, "
+              f"{result['failed']} failed")
+        for line in result['requests']:
+            print(f"  {line}")
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key not in ('worker', 'api_url', 'json')}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+    return 1 if any(result['failed'] for result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Benchmark of the whole-library export (--export) over a synthetic output directory.
+
+Writes --cards card folders (card PNG, HTML report, manifest and gallery images, so
+about half the bytes are compressible), then compares a serial zipfile archive with
+export_library using one worker process and the default pool.
+
+    python benchmarks/export_library.py --cards 2000 --gallery-images 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+# Make the package and the fake server importable when run from a checkout
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchmark_directory))
+sys.path.insert(0, benchmark_directory)
+
+from fake_chub import make_card_png, make_node
+
+from chub_downloader.bundle import get_compress_type, manifest_file_name
+from chub_downloader.export import export_library, list_library_files
+from chub_downloader.report import generate_html
+
+def write_library(output_directory, cards, gallery_images, image_size, seed):
+    """
+    Writes cards synthetic card folders and returns the number of bytes written.
+    """
+    rng = random.Random(seed)
+    total = 0
+    for index in range(cards):
+        node = make_node(index)
+        card_dir = os.path.join(output_directory, node['name'])
+        os.makedirs(card_dir)
+        files = {
+            f"{node['name']}.png": make_card_png(node, 50 * 1024),
+            f"{node['name']}_info.html": generate_html(node).encode('utf-8'),
+            manifest_file_name: json.dumps({'id': node['id'], 'node': node}, indent=2).encode('utf-8'),
+        }
+        for number in range(gallery_images):
+            # Random bytes, like real image data, don't compress
+            files[f"{number}.png"] = rng.randbytes(image_size)
+        for file_name, data in files.items():
+            with open(os.path.join(card_dir, file_name), 'wb') as f:
+                f.write(data)
+            total += len(data)
+    return total
+
+def zip_serially(output_directory, archive_path):
+    """
+    The baseline: one zipfile archive, compressing each member in turn.
+    """
+    with zipfile.ZipFile(archive_path, 'w') as archive:
+        for name, path in list_library_files(output_directory):
+            archive.write(path, name, compress_type=get_compress_type(name))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the whole-library export.")
+    parser.add_argument('--cards', type=int, default=2000, help="Number of synthetic cards.")
+    parser.add_argument('--gallery-images', type=int, default=5, help="Gallery images per card.")
+    parser.add_argument('--image-size', type=int, default=20 * 1024, help="Size of each gallery image in bytes.")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the image bytes.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        library = os.path.join(work_directory, 'library')
+        os.makedirs(library)
+        total = write_library(library, args.cards, args.gallery_images, args.image_size, args.seed)
+        megabytes = total / 1024 / 1024
+        print(f"library: {args.cards} cards, {megabytes:.1f} MB")
+
+        cases = [
+            ('zipfile, serial', lambda path: zip_serially(library, path)),
+            ('export, 1 worker', lambda path: export_library(library, path, 1)),
+            ('export, default pool', lambda path: export_library(library, path)),
+        ]
+        for label, export in cases:
+            archive_path = os.path.join(work_directory, 'export.zip')
+            started = time.perf_counter()
+            export(archive_path)
+            seconds = time.perf_counter() - started
+            with zipfile.ZipFile(archive_path) as archive:
+                if archive.testzip() is not None:
+                    print(f"FAIL: {label} wrote a damaged archive", file=sys.stderr)
+                    return 1
+            print(f"{label:22} {seconds:7.2f} s {megabytes / seconds:8.1f} MB/s "
+                  f"archive {os.path.getsize(archive_path) / 1024 / 1024:.1f} MB")
+            os.remove(archive_path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Local stand-in for the Chub.ai API, for measuring the downloader offline.
+
+Serves characters/search, characters/download (of any version), gallery/project/{id},
+the version list (v4/projects/{id}/repository/commits) and the gallery images themselves,
+with configurable latency, payload sizes, gallery sizes (and so page counts), version
+counts, and 503 and 429 rates. Searches can be sorted by created_at or last_activity_at,
+and in-process users (see watch_poll.py) can publish and update cards while it runs.
+Only the standard library is used.
+
+    python benchmarks/fake_chub.py --port 8765 --cards 200 --gallery-images 30 --latency 20
+
+Then point the downloader at it with api_base_url = http://127.0.0.1:8765 in config.ini.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+def png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+def version_id(card_id, number):
+    """
+    Returns the commit id of version number of a card.
+    """
+    return hashlib.sha1(f"{card_id}-{number}".encode()).hexdigest()
+
+def revision_of(number, versions):
+    """
+    Returns the revision a version holds: every other version repeats the one before it
+    (with different padding, so only the card definition matches), and the newest is the
+    main card (revision None).
+    """
+    return None if number == versions - 1 else number // 2
+
+def make_card_png(node, size, revision=None, padding=b'x'):
+    """
+    Returns a small valid PNG holding the card's data in a 'chara' tEXt chunk,
+    padded with a comment chunk to about size bytes. Earlier revisions differ in their description.
+    """
+    description = node['description'] if revision is None else f"{node['description']} (revision {revision})"
+    card_data = {'spec': 'chara_card_v2', 'spec_version': '2.0', 'data': {'name': node['name'], 'description': description}}
+    header = png_chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+    chara = png_chunk(b'tEXt', b'chara\x00' + base64.b64encode(json.dumps(card_data).encode()))
+    pixels = png_chunk(b'IDAT', zlib.compress(b'\x00\x00\x00\x00'))
+    end = png_chunk(b'IEND', b'')
+    padding_size = max(0, size - 8 - len(header) - len(chara) - len(pixels) - len(end) - 12 - len(b'Comment\x00'))
+    comment = png_chunk(b'tEXt', b'Comment\x00' + padding * padding_size)
+    return b'\x89PNG\r\n\x1a\n' + header + chara + comment + pixels + end
+
+def make_node(index):
+    """
+    Returns the search node of synthetic card number index.
+    """
+    token_counts = {'total': 1200, 'description': 800, 'personality': 200, 'scenario': 200}
+    return {
+        'id': 100000 + index,
+        'fullPath': f"bench-creator-{index % 20}/bench-card-{index}",
+        'name': f"Bench Card {index}",
+        'description': f"# Bench Card {index}\n\nA synthetic card for benchmarks.\n\n" + "Some *markdown* text. " * 40,
+        'tagline': f"Synthetic card {index}",
+        'topics': ['Benchmark', f"Group{index % 7}"],
+        'labels': [{'title': 'TOKEN_COUNTS', 'description': json.dumps(token_counts)}],
+        'starCount': index,
+        'rating': 4.5,
+        'ratingCount': 10,
+        'nChats': index * 3,
+        # Later cards are newer, a minute apart, and were last edited half a minute after creation
+        'lastActivityAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(1685577600 + index * 60 + 30)),
+        'createdAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(1685577600 + index * 60)),
+        'avatar_url': '',
+    }
+
+# Search sort orders the server knows, by the node field they sort on
+sort_fields = {'created_at': 'createdAt', 'last_activity_at': 'lastActivityAt'}
+
+class FakeChubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def options(self):
+        return self.server.options
+
+    def send_body(self, body, content_type='application/json', status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def inject_failure(self):
+        """
+        Waits for the configured latency, then answers 429 or 503 at the configured rates.
+        Returns True if the request was answered with an error.
+        """
+        options = self.options
+        delay = options.latency + random.uniform(0, options.jitter)
+        if delay:
+            time.sleep(delay / 1000)
+        roll = random.random()
+        if roll < options.throttle_rate:
+            self.send_body(b'{}', status=429, headers={'Retry-After': str(options.retry_after)})
+            return True
+        if roll < options.throttle_rate + options.error_rate:
+            self.send_body(b'{}', status=503)
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if self.inject_failure():
+            return
+        if url.path == '/api/characters/search':
+            search = query.get('search', [''])[0].lower()
+            first = int(query.get('first', ['100'])[0])
+            page = int(query.get('page', ['1'])[0])
+            topics = [topic for topic in query.get('topics', [''])[0].lower().split(',') if topic]
+            username = query.get('username', [''])[0].lower()
+            nodes = [
+                node for node in self.server.nodes
+                if (search in node['fullPath'].lower() or search == node['name'].lower())
+                and all(topic in [tag.lower() for tag in node['topics']] for topic in topics)
+                and (not username or node['fullPath'].lower().startswith(username + '/'))
+            ]
+            sort_field = sort_fields.get(query.get('sort', [''])[0])
+            if sort_field:
+                nodes.sort(key=lambda node: node[sort_field], reverse=query.get('asc', ['true'])[0] == 'false')
+            body = {'count': len(nodes), 'nodes': nodes[(page - 1) * first:page * first]}
+            self.send_body(json.dumps(body).encode())
+        elif url.path.startswith('/api/gallery/project/'):
+            card_id = int(url.path.rsplit('/', 1)[1])
+            page = int(query.get('page', ['1'])[0])
+            limit = int(query.get('limit', ['24'])[0])
+            count = self.options.gallery_images if card_id in self.server.card_ids else 0
+            host = self.headers.get('Host')
+            image_nodes = [
+                {'primary_image_path': f"http://{host}/images/{card_id}/{number}.png"}
+                for number in range((page - 1) * limit, min(count, page * limit))
+            ]
+            self.send_body(json.dumps({'count': count, 'nodes': image_nodes}).encode())
+        elif url.path.startswith('/api/v4/projects/') and url.path.endswith('/repository/commits'):
+            card_id = int(url.path.split('/')[4])
+            page = int(query.get('page', ['1'])[0])
+            per_page = int(query.get('per_page', ['20'])[0])
+            count = self.options.versions if card_id in self.server.card_ids else 0
+            # Newest first, like the real history
+            commits = [
+                {'id': version_id(card_id, number), 'created_at': f"2024-01-{number % 28 + 1:02d}T00:00:00", 'title': f"Revision {number}"}
+                for number in reversed(range(count))
+            ][(page - 1) * per_page:page * per_page]
+            self.send_body(json.dumps(commits).encode())
+        elif url.path.startswith('/images/'):
+            etag = f'"{url.path}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_body(b'', status=304, headers={'ETag': etag})
+                return
+            # Every image has its own content, derived from its path
+            seed = zlib.crc32(url.path.encode()).to_bytes(4, 'big')
+            body = (seed * (self.options.image_size // 4 + 1))[:self.options.image_size]
+            self.send_body(body, 'image/png', headers={'ETag': etag})
+        else:
+            self.send_body(b'{}', status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.inject_failure():
+            return
+        node = self.server.nodes_by_path.get(body.get('fullPath'))
+        if url.path != '/api/characters/download' or node is None:
+            self.send_body(b'{}', status=404)
+            return
+        version = body.get('version', 'main')
+        if version == 'main':
+            self.send_body(self.server.card_pngs[node['fullPath']], 'image/png')
+            return
+        numbers = [number for number in range(self.options.versions) if version_id(node['id'], number) == version]
+        if not numbers:
+            self.send_body(b'{}', status=404)
+            return
+        self.send_body(make_card_png(node, self.options.card_size, revision_of(numbers[0], self.options.versions), b'y' if numbers[0] % 2 else b'x'), 'image/png')
+
+class FakeChubServer(ThreadingHTTPServer):
+    """
+    The fake API server; options is an argparse namespace from parse_args.
+    """
+    daemon_threads = True
+
+    def __init__(self, options):
+        super().__init__((options.host, options.port), FakeChubHandler)
+        self.options = options
+        self.nodes = []
+        self.card_ids = set()
+        self.nodes_by_path = {}
+        self.card_pngs = {}
+        self.add_cards(options.cards)
+
+    def add_cards(self, count):
+        """
+        Publishes count new cards, newer than every card so far.
+        """
+        for index in range(len(self.nodes), len(self.nodes) + count):
+            node = make_node(index)
+            self.card_pngs[node['fullPath']] = make_card_png(node, self.options.card_size)
+            self.nodes_by_path[node['fullPath']] = node
+            self.card_ids.add(node['id'])
+            # Appended last, so a search never sees a card whose PNG isn't ready
+            self.nodes.append(node)
+
+    def update_card(self, index):
+        """
+        Marks card number index as edited now, as a new version would.
+        """
+        self.nodes[index]['lastActivityAt'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime())
+
+    def handle_error(self, request, client_address):
+        # Clients close connections after error responses; that's expected here
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Serves requests on a background thread and returns the base URL.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.base_url
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Chub.ai API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on, 0 for any free port.")
+    parser.add_argument('--cards', type=int, default=200, help="Number of cards the server knows.")
+    parser.add_argument('--gallery-images', type=int, default=30,
+                        help="Gallery images per card; the client reads them in pages of 24.")
+    parser.add_argument('--versions', type=int, default=1,
+                        help="Versions per card; every other one repeats the one before it.")
+    parser.add_argument('--card-size', type=int, default=200 * 1024, help="Size of each card PNG in bytes.")
+    parser.add_argument('--image-size', type=int, default=150 * 1024, help="Size of each gallery image in bytes.")
+    parser.add_argument('--latency', type=float, default=0, help="Milliseconds to wait before every response.")
+    parser.add_argument('--jitter', type=float, default=0, help="Extra random milliseconds, up to this many.")
+    parser.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with 503.")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="Fraction of requests answered with 429.")
+    parser.add_argument('--retry-after', type=float, default=0, help="Retry-After seconds sent with 429 responses.")
+    parser.add_argument('--seed', type=int, help="Seed for the error and latency randomness.")
+    return parser
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.seed is not None:
+        random.seed(options.seed)
+    server = FakeChubServer(options)
+    # The harness reads the address from the first line
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
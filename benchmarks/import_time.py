@@ -0,0 +1,83 @@
+"""
+Measures how long a fresh Python process takes to import the chub_downloader library.
+
+Each sample spawns a new interpreter, so nothing is cached in memory between runs.
+The interpreter's own startup (an empty `python -c pass`) is measured the same way and
+subtracted. Exits with status 1 if the median import time exceeds --threshold, or if
+importing the library pulled in one of the heavy modules that should only load on use.
+
+    python benchmarks/import_time.py --runs 20 --threshold 50
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Root of the repository, so the benchmark works from any working directory
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that importing the library must not load
+heavy_modules = ['requests', 'markdown', 'ttkbootstrap', 'tkinter', 'asyncio', 'PIL']
+
+def time_command(code, working_directory):
+    """
+    Returns the wall-clock seconds a fresh interpreter takes to run code.
+    """
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=working_directory, check=True)
+    return time.perf_counter() - started
+
+def check_side_effects(working_directory):
+    """
+    Imports the library in a fresh interpreter and returns the heavy modules it loaded
+    and the files it created in the working directory.
+    """
+    before = set(os.listdir(working_directory))
+    code = (
+        f"import sys; sys.path.insert(0, {repo_root!r}); import chub_downloader; "
+        f"print(' '.join(name for name in {heavy_modules!r} if name in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=working_directory,
+                            check=True, capture_output=True, text=True).stdout
+    created = sorted(set(os.listdir(working_directory)) - before)
+    return output.split(), created
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the import time of chub_downloader.")
+    parser.add_argument('--runs', type=int, default=20, help="Number of processes to spawn per measurement.")
+    parser.add_argument('--threshold', type=float, default=50.0,
+                        help="Fail if the median import time exceeds this many milliseconds.")
+    args = parser.parse_args(argv)
+
+    # Run in an empty directory so a stray config.ini or error.log would be noticed
+    with tempfile.TemporaryDirectory() as working_directory:
+        import_code = f"import sys; sys.path.insert(0, {repo_root!r}); import chub_downloader"
+        # Warm up once so bytecode compilation isn't counted
+        time_command(import_code, working_directory)
+
+        baseline = [time_command('pass', working_directory) for _ in range(args.runs)]
+        imports = [time_command(import_code, working_directory) for _ in range(args.runs)]
+        loaded, created = check_side_effects(working_directory)
+
+    baseline_ms = statistics.median(baseline) * 1000
+    import_ms = statistics.median(imports) * 1000 - baseline_ms
+    print(f"interpreter startup: {baseline_ms:.1f} ms (median of {args.runs})")
+    print(f"import chub_downloader: {import_ms:.1f} ms (median of {args.runs}, startup subtracted)")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: importing the library loaded {', '.join(loaded)}")
+        failed = True
+    if created:
+        print(f"FAIL: importing the library created {', '.join(created)}")
+        failed = True
+    if import_ms > args.threshold:
+        print(f"FAIL: import time is above the {args.threshold:.0f} ms threshold")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark of the HTML report renderer over synthetic card nodes.
+
+Compares a fresh markdown.markdown() call per card with the reused converter, and
+reports the render time and size of a report with an inlined or a linked stylesheet.
+
+    python benchmarks/render_report.py --cards 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# Make the package importable when run from a checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown
+
+from chub_downloader.report import convert_markdown, generate_html, stylesheet_file_name
+
+def make_node(index, rng):
+    """
+    Returns a synthetic search node shaped like the ones the Chub.ai API returns.
+    """
+    paragraphs = [
+        f"**{rng.choice(['Bold', 'Quiet', 'Curious'])}** character number {index} with *emphasis* & <angle> text."
+        for _ in range(rng.randint(2, 8))
+    ]
+    description = f"# Card {index}\n\n" + '\n\n'.join(paragraphs) + "\n\n- one\n- two\n- three\n"
+    token_counts = {'total': 1200, 'description': 800, 'personality': 200, 'scenario': 200, 'mes_example': 0}
+    return {
+        'id': 100000 + index,
+        'fullPath': f"creator{index % 50}/card-{index}",
+        'name': f"Card {index} <\"quoted\">",
+        'description': description,
+        'tagline': f"Tagline {index} & more",
+        'topics': rng.sample(['Fantasy', 'Female', 'Male', 'OC', 'SFW', 'Roleplay', 'Horror'], 3),
+        'labels': [{'title': 'TOKEN_COUNTS', 'description': json.dumps(token_counts)}],
+        'starCount': rng.randint(0, 10000),
+        'rating': round(rng.uniform(1, 5), 2),
+        'ratingCount': rng.randint(0, 500),
+        'nChats': rng.randint(0, 1000),
+        'lastActivityAt': '2024-01-01T00:00:00',
+        'createdAt': '2023-06-01T00:00:00',
+        'avatar_url': f"https://avatars.charhub.io/avatars/creator/card-{index}/avatar.webp",
+    }
+
+def measure(function, nodes):
+    """
+    Returns the seconds function takes over all nodes and the total length of its output.
+    """
+    started = time.perf_counter()
+    total_size = 0
+    for node in nodes:
+        total_size += len(function(node))
+    return time.perf_counter() - started, total_size
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the HTML report renderer.")
+    parser.add_argument('--cards', type=int, default=5000, help="Number of synthetic cards to render.")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the synthetic cards.")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    nodes = [make_node(index, rng) for index in range(args.cards)]
+    # Warm up imports and the converter
+    generate_html(nodes[0])
+
+    cases = [
+        ('markdown.markdown() per card', lambda node: markdown.markdown(node['description'])),
+        ('reused Markdown converter', lambda node: convert_markdown(node['description'])),
+        ('report, inline stylesheet', generate_html),
+        ('report, shared stylesheet', lambda node: generate_html(node, f"../{stylesheet_file_name}")),
+    ]
+    for label, function in cases:
+        seconds, total_size = measure(function, nodes)
+        print(f"{label:30} {seconds * 1e6 / args.cards:8.1f} us/card {total_size / args.cards / 1024:8.2f} KiB/card")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
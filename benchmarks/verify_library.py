@@ -0,0 +1,68 @@
+"""
+Benchmark of the library verifier (--verify) over a synthetic output directory.
+
+Writes --cards card folders with card PNGs like the fake server's (see fake_chub.py),
+damages a few, then times verify_library with one worker and with the default pool.
+
+    python benchmarks/verify_library.py --cards 5000 --card-size 500000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Make the package and the fake server importable when run from a checkout
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchmark_directory))
+sys.path.insert(0, benchmark_directory)
+
+from fake_chub import make_card_png, make_node
+
+from chub_downloader.bundle import manifest_file_name
+from chub_downloader.cardpng import verify_library
+
+def write_library(output_directory, cards, card_size, damaged):
+    """
+    Writes cards card folders, flipping a byte in the PNG of every damaged-th card.
+    Returns the number of damaged cards.
+    """
+    damaged_count = 0
+    for index in range(cards):
+        node = make_node(index)
+        card_dir = os.path.join(output_directory, node['name'])
+        os.makedirs(card_dir)
+        png = bytearray(make_card_png(node, card_size))
+        if damaged and index % damaged == 0:
+            png[len(png) // 2] ^= 0xff
+            damaged_count += 1
+        png_name = f"{node['name']}.png"
+        with open(os.path.join(card_dir, png_name), 'wb') as f:
+            f.write(png)
+        with open(os.path.join(card_dir, manifest_file_name), 'w', encoding='utf-8') as f:
+            json.dump({'id': node['id'], 'card': {'file': png_name}}, f)
+    return damaged_count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the card PNG verifier.")
+    parser.add_argument('--cards', type=int, default=5000, help="Number of synthetic cards to verify.")
+    parser.add_argument('--card-size', type=int, default=200 * 1024, help="Size of each card PNG in bytes.")
+    parser.add_argument('--damaged', type=int, default=100, metavar='N', help="Damage every Nth card, 0 for none.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as output_directory:
+        damaged_count = write_library(output_directory, args.cards, args.card_size, args.damaged)
+        for label, workers in (('1 worker', 1), ('default pool', None)):
+            started = time.perf_counter()
+            failed = sum(1 for result in verify_library(output_directory, workers) if result['status'] != 'ok')
+            seconds = time.perf_counter() - started
+            print(f"{label:14} {args.cards / seconds:9.0f} cards/s "
+                  f"{args.cards * args.card_size / seconds / 1024 / 1024:8.0f} MiB/s, {failed} damaged found")
+            if failed != damaged_count:
+                print(f"FAIL: expected {damaged_count} damaged cards", file=sys.stderr)
+                return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Benchmark of the watch mode's polls (--watch) against the local stand-in API.
+
+Starts fake_chub.py's server in this process with --cards cards, all tagged Benchmark,
+and compares a full re-scan of the tag (what --mirror reads) with the watch's polls:
+the first poll, which sets the high-water marks, a poll with nothing new, and a poll
+after --new cards were published and --updated cards were edited.
+
+    python benchmarks/watch_poll.py --cards 5000 --new 5 --updated 3
+"""
+import argparse
+import os
+import sys
+import time
+
+# Make the package and the fake server importable when run from a checkout
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchmark_directory))
+sys.path.insert(0, benchmark_directory)
+
+import fake_chub
+
+from chub_downloader import config, iter_search_results
+from chub_downloader.metrics import add_listener
+from chub_downloader.watch import get_watch_sources, poll_watch_sources
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the watch mode's incremental polls.")
+    parser.add_argument('--cards', type=int, default=5000, help="Number of cards the server starts with.")
+    parser.add_argument('--new', type=int, default=5, help="Cards published before the last poll.")
+    parser.add_argument('--updated', type=int, default=3, help="Existing cards edited before the last poll.")
+    args = parser.parse_args(argv)
+
+    server = fake_chub.FakeChubServer(fake_chub.parse_args(['--port', '0', '--cards', str(args.cards), '--card-size', '1024']))
+    config['Settings']['api_base_url'] = server.start()
+    config['Settings']['watch_tags'] = 'Benchmark'
+
+    # Search response bytes, from the search stage events
+    search_bytes = []
+    add_listener(lambda event: search_bytes.append(event['bytes'])
+                 if event.get('event') == 'stage' and event.get('stage') == 'search' else None)
+
+    def measure(label, run):
+        search_bytes.clear()
+        started = time.perf_counter()
+        found, requests = run()
+        seconds = time.perf_counter() - started
+        print(f"{label:24} {requests:5d} requests {sum(search_bytes) / 1024:10.1f} KiB {seconds * 1000:9.1f} ms, {found} cards")
+        return found
+
+    def full_scan():
+        cards = sum(1 for _ in iter_search_results(tags=['Benchmark']))
+        return cards, len(search_bytes)
+
+    sources = get_watch_sources()
+    state = {'marks': {}, 'pending': {}}
+
+    def poll():
+        found, requests, errors = poll_watch_sources(sources, state, '')
+        if errors:
+            raise RuntimeError('; '.join(errors))
+        return found, requests
+
+    measure('full re-scan', full_scan)
+    measure('first poll (marks)', poll)
+    quiet = measure('poll, nothing new', poll)
+    server.add_cards(args.new)
+    for index in range(args.updated):
+        server.update_card(index)
+    found = measure(f"poll, {args.new} new {args.updated} updated", poll)
+    server.shutdown()
+
+    expected = args.new + args.updated
+    if quiet or found != expected:
+        print(f"FAIL: expected 0 and {expected} cards, found {quiet} and {found}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
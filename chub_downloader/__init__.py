@@ -0,0 +1,20 @@
+"""
+Chub.ai card downloader.
+
+Importing the package is cheap and has no side effects: requests, markdown, asyncio
+and the GUI toolkit are only imported when they are first used, and config.ini is
+only read by the command line and GUI (see load_config).
+"""
+from .config import config, load_config, save_config
+from .index import rebuild_index, search_index
+from .pipeline import DownloadEngine, download_card_node, download_card_pipeline, resolve_card
+from .report import generate_html
+from .search import iter_search_results, search_cards
+
+__all__ = [
+    'config', 'load_config', 'save_config',
+    'rebuild_index', 'search_index',
+    'DownloadEngine', 'download_card_node', 'download_card_pipeline', 'resolve_card',
+    'generate_html',
+    'iter_search_results', 'search_cards',
+]
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+
+from .bundle import save_response_atomically
+
+# Folder in the output directory that holds the deduplicated gallery images
+blob_folder_name = '.blobs'
+
+# Record of which image URL holds which blob, kept in the blob folder
+blob_urls_file_name = 'urls.jsonl'
+
+class BlobStore:
+    """
+    Content-addressed store of gallery images in an output directory, so an image shared
+    by several cards (forks, re-uploads) is downloaded and stored only once.
+    Images are named by their SHA-256, computed while they stream in, and card folders
+    get hardlinks to them. The image URLs already stored are remembered, so those images
+    are linked without any request at all.
+    """
+    def __init__(self, output_directory):
+        self.path = os.path.join(output_directory, blob_folder_name)
+        self.urls_path = os.path.join(self.path, blob_urls_file_name)
+        self.urls = {}
+        self.lock = threading.Lock()
+        if os.path.exists(self.urls_path):
+            with open(self.urls_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.urls[record['url']] = record
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        # A torn line from a crash; the image is simply downloaded again
+                        continue
+
+    def blob_path(self, sha256):
+        # Spread the blobs over subfolders so no folder gets too large
+        return os.path.join(self.path, sha256[:2], sha256)
+
+    def lookup(self, url):
+        """
+        Returns the stored record of an image URL ('url', 'sha256', 'etag', 'last_modified'),
+        or None if the URL hasn't been stored or its blob is gone.
+        """
+        with self.lock:
+            record = self.urls.get(url)
+        if record and os.path.exists(self.blob_path(record['sha256'])):
+            return record
+        return None
+
+    def store_response(self, url, response):
+        """
+        Streams an image response into the store, hashing it on the way.
+        Returns the image's record and the number of bytes downloaded.
+        """
+        import hashlib
+
+        os.makedirs(self.path, exist_ok=True)
+        # One download at a time per thread, so the thread id keeps temp names apart
+        temp_path = os.path.join(self.path, f"incoming-{os.getpid()}-{threading.get_ident()}")
+        digest = hashlib.sha256()
+        try:
+            written = save_response_atomically(response, temp_path, digest)
+            sha256 = digest.hexdigest()
+            blob_path = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if os.path.exists(blob_path):
+                # Same content under another URL; keep the blob that may already be linked
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, blob_path)
+        except BaseException:
+            # Images aren't resumed, so a failed or cancelled download leaves nothing behind
+            for leftover in (temp_path, f"{temp_path}.part"):
+                try:
+                    os.remove(leftover)
+                except FileNotFoundError:
+                    pass
+            raise
+
+        record = {
+            'url': url,
+            'sha256': sha256,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        with self.lock:
+            self.urls[url] = record
+            with open(self.urls_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        return record, written
+
+# Open blob stores by output directory
+blob_stores = {}
+blob_stores_lock = threading.Lock()
+
+def open_blob_store(output_directory):
+    """
+    Returns the blob store of an output directory, shared by every download into it.
+    """
+    store_path = os.path.abspath(output_directory)
+    with blob_stores_lock:
+        if store_path not in blob_stores:
+            blob_stores[store_path] = BlobStore(store_path)
+        return blob_stores[store_path]
@@ -0,0 +1,168 @@
+import os
+import shutil
+import threading
+import time
+
+from .config import get_int_setting
+from .metrics import check_cancelled
+
+# Bytes reserved for a response that doesn't say how big it is
+unknown_transfer_size = 1024 * 1024
+
+# How often a waiting transfer checks whether its card was cancelled, in seconds
+budget_poll_interval = 0.5
+
+class InsufficientDiskSpace(OSError):
+    """
+    Raised before a card starts if the output directory's drive is too full to hold it.
+    """
+
+class TransferBudget:
+    """
+    Limits the file downloads in flight across every card: how many files are coming in
+    at once and how many bytes they may add up to. The bytes of a download are held from
+    the moment its size is known until it is saved, covering the zip spool in memory and
+    the .part file or spool on disk. A download that doesn't fit waits, so new card and
+    gallery fetches slow down instead of running the machine out of memory or disk.
+    One download larger than the whole budget still runs, once it's the only one.
+    """
+    def __init__(self, max_bytes, max_files):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.bytes = 0
+        self.files = 0
+        self.peak_bytes = 0
+        self.peak_files = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.condition = threading.Condition()
+
+    def wait_until(self, ready):
+        # Called with the condition held; counts the time spent waiting
+        if ready():
+            return
+        started = time.perf_counter()
+        try:
+            while not ready():
+                self.condition.wait(budget_poll_interval)
+                check_cancelled()
+        finally:
+            self.waits += 1
+            self.wait_seconds += time.perf_counter() - started
+
+    def acquire_file(self):
+        with self.condition:
+            self.wait_until(lambda: self.files < self.max_files)
+            self.files += 1
+            self.peak_files = max(self.peak_files, self.files)
+
+    def release_file(self):
+        with self.condition:
+            self.files -= 1
+            self.condition.notify_all()
+
+    def acquire_bytes(self, size):
+        # Only transfers holding no bytes wait here, so the ones holding bytes always finish
+        with self.condition:
+            self.wait_until(lambda: self.bytes == 0 or self.bytes + size <= self.max_bytes)
+            self.bytes += size
+            self.peak_bytes = max(self.peak_bytes, self.bytes)
+
+    def release_bytes(self, size):
+        with self.condition:
+            self.bytes -= size
+            self.condition.notify_all()
+
+    def transfer(self):
+        """
+        Returns a context manager holding a file slot for one download; see Transfer.
+        """
+        return Transfer(self)
+
+class Transfer:
+    """
+    One download's share of a TransferBudget. Entering waits for a file slot, so enter it
+    before sending the request; call reserve(response) once the headers are in.
+
+    Usage:
+        with get_transfer_budget().transfer() as transfer:
+            with send_request('GET', url, stream=True) as response:
+                transfer.reserve(response)
+                card_writer.write_response(file_name, response)
+    """
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+
+    def __enter__(self):
+        self.budget.acquire_file()
+        return self
+
+    def reserve(self, response):
+        """
+        Waits until the response's body fits in the budget and holds its size
+        (from Content-Length) until the transfer ends.
+        """
+        if self.size:
+            return
+        try:
+            size = int(response.headers.get('Content-Length', ''))
+        except ValueError:
+            size = unknown_transfer_size
+        self.budget.acquire_bytes(size)
+        self.size = size
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.size:
+            self.budget.release_bytes(self.size)
+            self.size = 0
+        self.budget.release_file()
+        return False
+
+# Budget shared by every download in this process, created on first use
+transfer_budget = None
+transfer_budget_lock = threading.Lock()
+
+def get_transfer_budget():
+    """
+    Returns the shared transfer budget, sized by the max_inflight_mb and max_inflight_files settings.
+    """
+    global transfer_budget
+    with transfer_budget_lock:
+        if transfer_budget is None:
+            transfer_budget = TransferBudget(
+                get_int_setting('max_inflight_mb', minimum=1) * 1024 * 1024,
+                get_int_setting('max_inflight_files', minimum=1)
+            )
+        return transfer_budget
+
+def check_free_space(output_directory, needed=0):
+    """
+    Raises InsufficientDiskSpace unless the drive of the output directory has room for
+    needed bytes, the downloads in flight and the min_free_space_mb setting on top.
+    """
+    reserve = get_int_setting('min_free_space_mb', minimum=0) * 1024 * 1024
+    if not reserve and not needed:
+        return
+    free = shutil.disk_usage(output_directory).free
+    in_flight = transfer_budget.bytes if transfer_budget is not None else 0
+    if free - in_flight - needed < reserve:
+        message = f"Not enough free space in {os.path.abspath(output_directory)}: {free / 1024 / 1024:.0f} MB free"
+        if in_flight:
+            message += f", {in_flight / 1024 / 1024:.0f} MB of downloads in flight"
+        if needed:
+            message += f", {needed / 1024 / 1024:.0f} MB to rebuild the card's archive"
+        raise InsufficientDiskSpace(f"{message}, and min_free_space_mb keeps {reserve / 1024 / 1024:.0f} MB free.")
+
+def format_budget_stats():
+    """
+    Returns a line with the peak bytes and files in flight and the time downloads waited for
+    the budget, or None if nothing was downloaded.
+    """
+    budget = transfer_budget
+    if budget is None or not budget.peak_files:
+        return None
+    with budget.condition:
+        return (f"Transfer budget: peak {budget.peak_bytes / 1024 / 1024:.1f} of {budget.max_bytes / 1024 / 1024:.0f} MB, "
+                f"{budget.peak_files} of {budget.max_files} files in flight; "
+                f"{budget.waits} downloads waited {budget.wait_seconds:.2f} s")
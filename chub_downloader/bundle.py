@@ -0,0 +1,289 @@
+import json
+import logging
+import os
+import re  # Import regular expressions module
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from .metrics import report_progress
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks streamed from a response to disk
+download_chunk_size = 64 * 1024
+
+# Downloads bound for a zip archive are kept in memory up to this size before spilling to a temp file
+zip_spool_size = 4 * 1024 * 1024
+
+# Name of the per-card manifest used to skip unchanged files on re-download
+manifest_file_name = 'manifest.json'
+
+# File types that are already compressed and are stored in zip archives as-is
+precompressed_extensions = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.avif', '.mp4', '.webm'}
+
+def save_response_atomically(response, file_path, digest=None, resume=False, check=None):
+    """
+    Streams a response body in chunks into a temporary file next to file_path,
+    then renames it into place, so a finished-looking file is always complete.
+    If digest is given (a hashlib object) it is updated with the whole file.
+    With resume, a 206 response is appended to the partial file left by an earlier attempt.
+    If check is given it is called with the temporary file's path before the rename;
+    whatever it raises discards the file.
+    Returns the number of bytes written.
+    """
+    import requests
+
+    temp_path = f"{file_path}.part"
+    written = 0
+    mode = 'wb'
+    if resume and response.status_code == 206:
+        offset = os.path.getsize(temp_path)
+        if not response.headers.get('Content-Range', '').startswith(f"bytes {offset}-"):
+            raise ValueError(f"Unexpected Content-Range for {file_path}: {response.headers.get('Content-Range')}")
+        mode = 'ab'
+        if digest is not None:
+            with open(temp_path, 'rb') as partial_file:
+                for chunk in iter(lambda: partial_file.read(download_chunk_size), b''):
+                    digest.update(chunk)
+    try:
+        with open(temp_path, mode) as temp_file:
+            for chunk in response.iter_content(chunk_size=download_chunk_size):
+                temp_file.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                written += len(chunk)
+                report_progress(len(chunk))
+        if check is not None:
+            check(temp_path)
+        os.replace(temp_path, file_path)
+    except requests.exceptions.RequestException:
+        # Keep what arrived so a later attempt can continue with a Range request
+        raise
+    except BaseException:
+        # Never leave a partial file behind
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return written
+
+def link_file(source_path, file_path):
+    """
+    Puts a hardlink to source_path at file_path, replacing any file there.
+    Falls back to a copy where hardlinks aren't possible (other drive, FAT, no permission).
+    """
+    temp_path = f"{file_path}.part"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source_path, temp_path)
+    except OSError:
+        shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, file_path)
+
+class CardFolderWriter:
+    """
+    Writes the files of a card into its own folder.
+    Completed files survive an interruption, so an interrupted download can be resumed.
+    """
+    resumable = True
+
+    def __init__(self, card_dir):
+        self.path = card_dir
+        if not os.path.exists(card_dir):
+            os.makedirs(card_dir)
+
+    def read_manifest(self):
+        manifest_path = os.path.join(self.path, manifest_file_name)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as err:
+            logger.error(f"Ignoring unreadable manifest {manifest_path}: {err}")
+            return None
+
+    def read_text(self, file_name):
+        file_path = os.path.join(self.path, file_name)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, encoding='utf-8') as f:
+            return f.read()
+
+    def has_file(self, file_name):
+        return os.path.exists(os.path.join(self.path, file_name))
+
+    def keep_file(self, file_name):
+        # The previous file is already in place
+        pass
+
+    def partial_size(self, file_name):
+        temp_path = os.path.join(self.path, f"{file_name}.part")
+        return os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+
+    def write_text(self, file_name, text):
+        file_path = os.path.join(self.path, file_name)
+        with open(f"{file_path}.part", 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(f"{file_path}.part", file_path)
+
+    def write_response(self, file_name, response, digest=None, resume=False, check=None):
+        file_path = os.path.join(self.path, file_name)
+        # File names may include a subfolder, e.g. versions/
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        return save_response_atomically(response, file_path, digest, resume, check)
+
+    def file_source(self, file_name):
+        # Path of a file already in the folder
+        return os.path.join(self.path, file_name)
+
+    def write_file(self, file_name, source_path):
+        # A hardlink takes no extra space; see link_file
+        link_file(source_path, os.path.join(self.path, file_name))
+
+    def close(self):
+        pass
+
+    def discard(self):
+        # Every file is written atomically, so finished files can stay
+        pass
+
+class CardZipWriter:
+    """
+    Writes the files of a card straight into a zip archive, without a staging folder.
+    Images are stored as-is since they are already compressed; text files are deflated.
+    The archive is built under a temporary name and renamed into place on close.
+    Files kept from an earlier download are copied over from the previous archive.
+    An unfinished archive can't be reopened, so an interrupted card starts over.
+    """
+    resumable = False
+
+    def __init__(self, zip_path):
+        self.path = zip_path
+        self.temp_path = f"{zip_path}.part"
+        self.previous_zip = None
+        if os.path.exists(zip_path):
+            try:
+                self.previous_zip = zipfile.ZipFile(zip_path)
+            except zipfile.BadZipFile as err:
+                logger.error(f"Ignoring unreadable archive {zip_path}: {err}")
+        self.kept_files = []
+        self.zip_file = zipfile.ZipFile(self.temp_path, 'w')
+        # Gallery workers add members concurrently, but a zip file takes one at a time
+        self.lock = threading.Lock()
+
+    def read_manifest(self):
+        if not self.has_file(manifest_file_name):
+            return None
+        try:
+            return json.loads(self.previous_zip.read(manifest_file_name))
+        except (zipfile.BadZipFile, json.JSONDecodeError) as err:
+            logger.error(f"Ignoring unreadable manifest in {self.path}: {err}")
+            return None
+
+    def read_text(self, file_name):
+        if not self.has_file(file_name):
+            return None
+        return self.previous_zip.read(file_name).decode('utf-8')
+
+    def has_file(self, file_name):
+        return self.previous_zip is not None and file_name in self.previous_zip.NameToInfo
+
+    def keep_file(self, file_name):
+        # Copied from the previous archive on close, and only if the new archive is kept
+        with self.lock:
+            self.kept_files.append(file_name)
+
+    def partial_size(self, file_name):
+        return 0
+
+    def file_source(self, file_name):
+        # Contents of a file in the previous archive
+        return self.previous_zip.read(file_name)
+
+    def write_text(self, file_name, text):
+        with self.lock:
+            self.zip_file.writestr(file_name, text.encode('utf-8'), compress_type=zipfile.ZIP_DEFLATED)
+
+    def write_response(self, file_name, response, digest=None, resume=False, check=None):
+        # Download into a spool first so slow responses don't hold the archive lock.
+        # A large spool spills next to the archive rather than into the system temp
+        # folder, which is often in memory and always on a drive nobody checked for space.
+        with tempfile.SpooledTemporaryFile(max_size=zip_spool_size, dir=os.path.dirname(self.temp_path) or None) as spool:
+            written = 0
+            for chunk in response.iter_content(chunk_size=download_chunk_size):
+                spool.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                written += len(chunk)
+                report_progress(len(chunk))
+            spool.seek(0)
+            if check is not None:
+                # A file that fails the check never reaches the archive
+                check(spool)
+
+            zip_info = zipfile.ZipInfo(file_name, date_time=time.localtime()[:6])
+            zip_info.compress_type = get_compress_type(file_name)
+            zip_info.file_size = written
+            with self.lock:
+                with self.zip_file.open(zip_info, 'w') as member:
+                    shutil.copyfileobj(spool, member, download_chunk_size)
+        return written
+
+    def write_file(self, file_name, source_path):
+        zip_info = zipfile.ZipInfo(file_name, date_time=time.localtime()[:6])
+        zip_info.compress_type = get_compress_type(file_name)
+        zip_info.file_size = os.path.getsize(source_path)
+        with open(source_path, 'rb') as source, self.lock:
+            with self.zip_file.open(zip_info, 'w') as member:
+                shutil.copyfileobj(source, member, download_chunk_size)
+
+    def close(self):
+        for file_name in self.kept_files:
+            previous_info = self.previous_zip.getinfo(file_name)
+            zip_info = zipfile.ZipInfo(file_name, date_time=previous_info.date_time)
+            zip_info.compress_type = previous_info.compress_type
+            zip_info.file_size = previous_info.file_size
+            with self.previous_zip.open(previous_info) as source, self.zip_file.open(zip_info, 'w') as member:
+                shutil.copyfileobj(source, member, download_chunk_size)
+        self.zip_file.close()
+        if self.previous_zip is not None:
+            self.previous_zip.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        self.zip_file.close()
+        if self.previous_zip is not None:
+            self.previous_zip.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def get_compress_type(file_name):
+    """
+    Returns the zip compression for a file: stored for already-compressed images, deflated otherwise.
+    """
+    if os.path.splitext(file_name)[1].lower() in precompressed_extensions:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def open_card_writer(card_dir, bundle_option):
+    """
+    Returns the writer for a card's files matching the bundle option.
+    """
+    if bundle_option == 'Zip':
+        return CardZipWriter(f"{card_dir}.zip")
+    return CardFolderWriter(card_dir)
+
+def sanitize_filename(name):
+    """
+    Removes invalid characters from filenames and directory names.
+    """
+    # Remove invalid characters for Windows filenames
+    invalid_chars = r'<>:"/\\|?*'
+    sanitized_name = re.sub(f'[{re.escape(invalid_chars)}]', '', name)
+    # Remove trailing spaces and periods
+    sanitized_name = sanitized_name.rstrip('. ')
+    return sanitized_name
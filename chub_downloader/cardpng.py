@@ -0,0 +1,210 @@
+import base64
+import binascii
+import json
+import mmap
+import os
+import struct
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .bundle import manifest_file_name
+
+# Every PNG starts with these bytes
+png_signature = b'\x89PNG\r\n\x1a\n'
+
+# Text chunk keywords holding the card definition; V3 cards also keep a V2 copy
+card_keywords = ('ccv3', 'chara')
+
+# Chunks whose text can hold a card definition
+text_chunk_types = (b'tEXt', b'zTXt', b'iTXt')
+
+chunk_header = struct.Struct('>I4s')
+
+class CardPngError(ValueError):
+    """
+    Raised for a card PNG that is damaged or holds no readable card definition.
+    """
+
+def iter_png_chunks(data, check_crc=True):
+    """
+    Yields (chunk_type, chunk_data) for every chunk of the PNG in data (bytes or an mmap),
+    up to and including IEND. chunk_data is a memoryview, so nothing is copied, and no
+    pixels are decoded. Raises CardPngError for a bad signature, a truncated chunk or,
+    with check_crc, a chunk whose CRC doesn't match.
+    """
+    view = memoryview(data)
+    if view[:8] != png_signature:
+        raise CardPngError("Not a PNG file.")
+    position = 8
+    end = len(view)
+    while True:
+        if position + 12 > end:
+            raise CardPngError("The PNG is truncated; IEND is missing.")
+        length, chunk_type = chunk_header.unpack_from(view, position)
+        data_end = position + 8 + length
+        if length > 0x7fffffff or data_end + 4 > end:
+            raise CardPngError(f"The PNG is truncated in a {chunk_type.decode('latin-1')} chunk.")
+        if check_crc:
+            # The CRC covers the chunk type and data; crc32 reads straight from the view
+            crc = zlib.crc32(view[position + 4:data_end])
+            if crc != struct.unpack_from('>I', view, data_end)[0]:
+                raise CardPngError(f"CRC mismatch in a {chunk_type.decode('latin-1')} chunk at byte {position}.")
+        yield chunk_type, view[position + 8:data_end]
+        if chunk_type == b'IEND':
+            return
+        position = data_end + 4
+
+def read_text_chunk(chunk_type, chunk_data):
+    """
+    Returns (keyword, text) of a tEXt, zTXt or iTXt chunk.
+    """
+    keyword, _, rest = bytes(chunk_data).partition(b'\x00')
+    if chunk_type == b'zTXt':
+        return keyword.decode('latin-1'), zlib.decompress(rest[1:]).decode('latin-1')
+    if chunk_type == b'iTXt':
+        compressed, rest = rest[0], rest[2:]
+        text = rest.split(b'\x00', 2)[2]
+        if compressed:
+            text = zlib.decompress(text)
+        return keyword.decode('latin-1'), text.decode('utf-8')
+    return keyword.decode('latin-1'), rest.decode('latin-1')
+
+def read_card_data(data, check_crc=True):
+    """
+    Returns the card definition embedded in a card PNG (bytes or an mmap) as a dict,
+    checking every chunk's CRC on the way. Raises CardPngError if the PNG is damaged
+    or holds no readable card definition.
+    """
+    texts = {}
+    for chunk_type, chunk_data in iter_png_chunks(data, check_crc):
+        # The keyword comes first, so other text chunks are skipped without copying them
+        if chunk_type in text_chunk_types and bytes(chunk_data[:6]).split(b'\x00', 1)[0].decode('latin-1') in card_keywords:
+            try:
+                keyword, text = read_text_chunk(chunk_type, chunk_data)
+            except (zlib.error, UnicodeDecodeError, IndexError) as err:
+                raise CardPngError(f"Unreadable text chunk: {err}")
+            texts.setdefault(keyword, text)
+    for keyword in card_keywords:
+        if keyword in texts:
+            try:
+                card_data = json.loads(base64.b64decode(texts[keyword]))
+            except (binascii.Error, ValueError) as err:
+                raise CardPngError(f"The '{keyword}' card data can't be decoded: {err}")
+            if not isinstance(card_data, dict):
+                raise CardPngError(f"The '{keyword}' card data isn't a JSON object.")
+            return card_data
+    raise CardPngError("The PNG holds no card data.")
+
+def read_card_png(source, check_crc=True):
+    """
+    Returns the card definition of a card PNG given as a path, bytes or a file object.
+    Files on disk are memory-mapped, so only the chunk headers and the card text are
+    copied into memory. Raises CardPngError (see read_card_data) or OSError.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return read_card_data(source, check_crc)
+    if not isinstance(source, (str, os.PathLike)):
+        # An open file, e.g. the spool a zip bundle downloads into
+        source.seek(0)
+        try:
+            return read_card_data(source.read(), check_crc)
+        finally:
+            source.seek(0)
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise CardPngError("The file is empty.")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            try:
+                return read_card_data(mapped, check_crc)
+            except CardPngError as err:
+                # The traceback holds views of the map, which would keep it from closing
+                message = str(err)
+    raise CardPngError(message)
+
+def get_card_fields(card_data):
+    """
+    Returns the report fields of a card definition: its spec and the fields the search
+    node doesn't have. Long texts like the greeting are left to the card itself.
+    """
+    # V2 and V3 cards keep the definition under 'data'; V1 cards are flat
+    data = card_data.get('data') if isinstance(card_data.get('data'), dict) else card_data
+    spec = card_data.get('spec') or 'chara_card_v1'
+    if card_data.get('spec_version'):
+        spec += f" {card_data['spec_version']}"
+    character_book = data.get('character_book') or {}
+    return {
+        'Spec': spec,
+        'Creator': data.get('creator') or '',
+        'Character Version': data.get('character_version') or '',
+        'Alternate Greetings': len(data.get('alternate_greetings') or []),
+        'Lorebook Entries': len(character_book.get('entries') or []) if isinstance(character_book, dict) else 0,
+        'Example Messages': 'Yes' if data.get('mes_example') else 'No',
+    }
+
+def hash_card_definition(card_data):
+    """
+    Returns a SHA-256 of a card definition that doesn't depend on its key order or
+    formatting, so re-encoded PNGs of the same definition get the same hash.
+    """
+    import hashlib  # Loads OpenSSL, so it's imported on first use rather than at import
+
+    canonical = json.dumps(card_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def summarize_card(card_data):
+    """
+    Returns what the manifest keeps of a card definition: its report fields and its hash.
+    """
+    return {'fields': get_card_fields(card_data), 'definition_sha256': hash_card_definition(card_data)}
+
+def verify_card(card_path):
+    """
+    Checks the card PNG of a downloaded card folder or zip archive.
+    Returns a result dict with 'path', 'status' ('ok' or 'failed') and 'message',
+    or None if the path doesn't hold a downloaded card.
+    """
+    base_name = os.path.basename(card_path)
+    try:
+        if os.path.isdir(card_path):
+            manifest_path = os.path.join(card_path, manifest_file_name)
+            png_name = f"{base_name}.png"
+            if os.path.exists(manifest_path):
+                with open(manifest_path, encoding='utf-8') as f:
+                    png_name = json.load(f).get('card', {}).get('file') or png_name
+            elif not os.path.exists(os.path.join(card_path, png_name)):
+                return None
+            source = os.path.join(card_path, png_name)
+            if not os.path.exists(source):
+                return {'path': card_path, 'status': 'failed', 'message': f"{png_name} is missing."}
+        elif card_path.lower().endswith('.zip'):
+            with zipfile.ZipFile(card_path) as zip_file:
+                png_name = f"{base_name[:-4]}.png"
+                if manifest_file_name in zip_file.NameToInfo:
+                    png_name = json.loads(zip_file.read(manifest_file_name)).get('card', {}).get('file') or png_name
+                if png_name not in zip_file.NameToInfo:
+                    return {'path': card_path, 'status': 'failed', 'message': f"{png_name} is missing."}
+                # Stored as-is in the archive, so this is a plain copy
+                source = zip_file.read(png_name)
+        else:
+            return None
+        read_card_png(source)
+    except (CardPngError, OSError, zipfile.BadZipFile, json.JSONDecodeError) as err:
+        return {'path': card_path, 'status': 'failed', 'message': str(err)}
+    return {'path': card_path, 'status': 'ok', 'message': ''}
+
+def verify_library(output_directory, workers=None):
+    """
+    Checks the card PNG of every card folder and zip archive in the output directory,
+    several at a time, and yields a result per card (see verify_card) in directory order.
+    """
+    card_paths = [
+        os.path.join(output_directory, entry)
+        for entry in sorted(os.listdir(output_directory))
+        if not entry.startswith('.')
+    ]
+    # zlib.crc32 releases the GIL on large buffers, so threads check PNGs in parallel
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as executor:
+        for result in executor.map(verify_card, card_paths):
+            if result is not None:
+                yield result
@@ -0,0 +1,289 @@
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+
+from .budget import format_budget_stats
+from .cardpng import verify_library
+from .config import config, get_int_setting, load_config
+from .export import export_library
+from .index import get_index_path, rebuild_index, search_index
+from .metrics import configure
+from .network import format_request_stats
+from .pipeline import DownloadEngine
+from .search import iter_search_results
+from .watch import get_watch_sources, load_watch_state, poll_watch_sources, save_watch_state
+
+def read_card_list(source):
+    """
+    Yields card names or fullPaths from a file object, one per line.
+    Blank lines and lines starting with '#' are ignored.
+    """
+    for line in source:
+        name = line.strip()
+        if name and not name.startswith('#'):
+            yield name
+
+def run_batch(card_source, output_directory, bundle_option, api_token, max_gallery_images=0, out=sys.stdout):
+    """
+    Downloads every card listed in card_source without the GUI, several at a time.
+    Writes one tab-separated result line per card as it finishes (status, name, bytes,
+    seconds, message) and returns the number of failed cards.
+    """
+    return run_downloads(read_card_list(card_source), output_directory, bundle_option, api_token, max_gallery_images, out)
+
+def run_mirror(args, output_directory, bundle_option, api_token, max_gallery_images=0, out=sys.stdout):
+    """
+    Downloads every card matching the --mirror query, tags and creator, streaming through
+    the search result pages as the downloads progress. Returns the number of failed cards.
+    """
+    nodes = iter_search_results(
+        args.mirror, api_token, tags=args.tag, creator=args.creator,
+        nsfw=not args.no_nsfw, nsfl=not args.no_nsfl,
+        min_rating=args.min_rating, max_cards=args.max_cards
+    )
+    return run_downloads(nodes, output_directory, bundle_option, api_token, max_gallery_images, out)
+
+def run_downloads(cards, output_directory, bundle_option, api_token, max_gallery_images=0, out=sys.stdout, on_result=None):
+    """
+    Downloads cards (names, fullPaths or search nodes) with the DownloadEngine and writes
+    a result line per card; shared by run_batch, run_mirror and run_watch.
+    on_result, if given, is called with each card's name and result as it finishes.
+    """
+    engine = DownloadEngine(
+        output_directory, bundle_option, api_token, max_gallery_images,
+        search_concurrency=get_int_setting('search_concurrency', minimum=1),
+        download_concurrency=get_int_setting('download_concurrency', minimum=1)
+    )
+
+    async def report():
+        failures = 0
+        async for name, result, elapsed in engine.run(cards):
+            if result['status'] == 'failed':
+                failures += 1
+            if on_result is not None:
+                on_result(name, result)
+            message = result['message']
+            if result['candidates']:
+                message += ' Matches: ' + ', '.join(node.get('fullPath', '') for node in result['candidates'])
+            # Keep each result on a single line
+            message = ' '.join(message.split())
+            print(f"{result['status']}\t{name}\t{result['bytes']}\t{elapsed:.2f}\t{message}", file=out, flush=True)
+        return failures
+
+    # Imported here so the other commands don't pay for asyncio
+    import asyncio
+
+    failures = asyncio.run(report())
+
+    # Report how often each host had to be retried or throttled us
+    for line in format_request_stats():
+        print(line, file=sys.stderr)
+    budget_stats = format_budget_stats()
+    if budget_stats:
+        print(budget_stats, file=sys.stderr)
+    return failures
+
+def print_index_results(rows, out=sys.stdout):
+    """
+    Writes card index search results as tab-separated lines.
+    """
+    for row in rows:
+        values = [row['id'], row['full_path'], row['name'], row['rating'], row['token_count'], row['tags'], row['path']]
+        print('\t'.join('' if value is None else str(value) for value in values), file=out)
+
+def run_verify(output_directory, out=sys.stdout):
+    """
+    Checks the card PNG of every downloaded card and writes a tab-separated line
+    (status, path, message) for each damaged one. Returns the number of damaged cards.
+    """
+    start_time = time.perf_counter()
+    checked = 0
+    failures = 0
+    for result in verify_library(output_directory):
+        checked += 1
+        if result['status'] != 'ok':
+            failures += 1
+            print(f"{result['status']}\t{result['path']}\t{result['message']}", file=out, flush=True)
+    elapsed = time.perf_counter() - start_time
+    rate = checked / elapsed if elapsed else 0
+    print(f"Verified {checked} cards in {elapsed:.2f} s ({rate:.0f} cards/s), {failures} damaged", file=sys.stderr)
+    return failures
+
+def run_export(output_directory, archive_path, out=sys.stdout):
+    """
+    Exports the whole library into one zip archive and reports its size and throughput.
+    """
+    summary = export_library(output_directory, archive_path, get_int_setting('export_workers', minimum=0))
+    seconds = summary['seconds']
+    megabytes = summary['bytes'] / 1024 / 1024
+    print(f"Exported {summary['cards']} cards ({summary['files']} files, {megabytes:.1f} MB) into {archive_path} "
+          f"({summary['archive_bytes'] / 1024 / 1024:.1f} MB) in {seconds:.2f} s, {megabytes / seconds if seconds else 0:.1f} MB/s",
+          file=out)
+
+def run_watch(output_directory, bundle_option, api_token, max_gallery_images=0, once=False, out=sys.stdout):
+    """
+    Polls the sources in the watch settings every watch_interval seconds and downloads the
+    new and updated cards each poll finds, until interrupted (or after one poll with once).
+    Cards that fail stay pending in the watch state and are tried again on the next poll.
+    Returns the number of cards that failed in the last poll.
+    """
+    sources = get_watch_sources()
+    interval = get_int_setting('watch_interval', minimum=1)
+    state = load_watch_state(output_directory)
+
+    def record(name, result):
+        # A node's name is its fullPath, the key it's pending under
+        if result['status'] != 'failed':
+            state['pending'].pop(name, None)
+
+    failures = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            found, requests, errors = poll_watch_sources(sources, state, api_token)
+            for error in errors:
+                print(f"Poll failed: {error}", file=sys.stderr)
+            # Saved before downloading, so the cards found survive an interruption
+            save_watch_state(output_directory, state)
+            print(f"Polled {len(sources)} sources with {requests} requests: {found} new or updated cards, "
+                  f"{len(state['pending'])} to download", file=sys.stderr, flush=True)
+            failures = 0
+            if state['pending']:
+                failures = run_downloads(list(state['pending'].values()), output_directory, bundle_option,
+                                         api_token, max_gallery_images, out, on_result=record)
+                save_watch_state(output_directory, state)
+            if once:
+                return failures
+            time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    except KeyboardInterrupt:
+        save_watch_state(output_directory, state)
+        print("Stopped watching.", file=sys.stderr)
+    return failures
+
+def parse_args(argv=None):
+    """
+    Parses the command-line options. Without --batch, --mirror, --watch, --rebuild-index, --verify, --export or --query
+    the GUI is started.
+    """
+    parser = argparse.ArgumentParser(description="Download character cards from Chub.ai.")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="Download every card listed in FILE (one name or fullPath per line, '-' for stdin) without the GUI.")
+    parser.add_argument('--output', metavar='DIR',
+                        help="Output directory (defaults to output_directory in config.ini).")
+    parser.add_argument('--bundle', choices=['Folder', 'Zip'],
+                        help="Bundle option (defaults to bundle_option in config.ini).")
+    parser.add_argument('--token',
+                        help="Chub.ai token (defaults to api_token in config.ini).")
+    parser.add_argument('--max-gallery-images', type=int, metavar='N',
+                        help="Download at most N gallery images per card, 0 for all (defaults to max_gallery_images in config.ini).")
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help="Rebuild the card index from the card folders and zip archives in the output directory.")
+    parser.add_argument('--export', metavar='ARCHIVE',
+                        help="Pack the whole output directory (card folders and zip archives) into the zip archive ARCHIVE.")
+    parser.add_argument('--verify', action='store_true',
+                        help="Check the card PNG of every downloaded card (chunk CRCs and embedded card data) and list the damaged ones.")
+    parser.add_argument('--query', metavar='TEXT', nargs='?', const='',
+                        help="Search the card index (full-text over name, tagline, description and tags).")
+    parser.add_argument('--mirror', metavar='QUERY', nargs='?', const='',
+                        help="Download every card matching QUERY on Chub.ai, page by page; combine with --tag and --creator, "
+                             "or leave QUERY out to mirror a tag or creator.")
+    parser.add_argument('--creator', metavar='NAME', help="With --mirror, only download cards by this creator.")
+    parser.add_argument('--max-cards', type=int, default=0, metavar='N',
+                        help="With --mirror, stop after N cards (default 0, meaning all matches).")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep polling the creators, tags and queries in watch_creators, watch_tags and watch_queries "
+                             "in config.ini every watch_interval seconds, and download their new and updated cards.")
+    parser.add_argument('--once', action='store_true', help="With --watch, poll once and exit, e.g. from cron.")
+    parser.add_argument('--no-nsfw', action='store_true', help="With --mirror, leave out NSFW cards.")
+    parser.add_argument('--no-nsfl', action='store_true', help="With --mirror, leave out NSFL cards.")
+    parser.add_argument('--tag', action='append', default=[],
+                        help="Only list (or with --mirror, download) cards with this tag (can be repeated).")
+    parser.add_argument('--min-rating', type=float,
+                        help="Only list (or with --mirror, download) cards with at least this rating.")
+    parser.add_argument('--max-tokens', type=int, help="Only list indexed cards with at most this many tokens.")
+    parser.add_argument('--limit', type=int, default=50, help="Maximum number of indexed cards to list.")
+    parser.add_argument('--event-log', metavar='FILE',
+                        help="Append a JSON line per download stage to FILE (defaults to event_log in config.ini).")
+    parser.add_argument('--metrics-textfile', metavar='FILE',
+                        help="Keep per-stage Prometheus metrics in FILE (defaults to metrics_textfile in config.ini).")
+    args = parser.parse_args(argv)
+    if args.mirror is not None and (args.batch or args.query is not None):
+        parser.error("--mirror can't be combined with --batch or --query")
+    if args.mirror == '' and not (args.tag or args.creator):
+        parser.error("--mirror needs a query, --tag or --creator")
+    if args.watch and (args.batch or args.mirror is not None or args.query is not None):
+        parser.error("--watch can't be combined with --batch, --mirror or --query")
+    if args.once and not args.watch:
+        parser.error("--once needs --watch")
+    if args.watch and not get_watch_sources():
+        parser.error("nothing to watch; set watch_creators, watch_tags or watch_queries in config.ini")
+    headless = args.batch or args.mirror is not None or args.watch or args.rebuild_index or args.verify or args.export or args.query is not None
+    if headless and not (args.output or config['Settings']['output_directory']):
+        parser.error("no output directory set; pass --output or set output_directory in config.ini")
+    return args
+
+def main(argv=None):
+    """
+    Entry point: runs a headless batch download, mirror, watch, verify, export or card index command if requested,
+    otherwise the GUI.
+    """
+    # Configure logging
+    logging.basicConfig(filename='error.log', level=logging.ERROR,
+                        format='%(asctime)s:%(levelname)s:%(message)s')
+    load_config()
+
+    args = parse_args(argv)
+    configure(
+        args.event_log if args.event_log is not None else config['Settings']['event_log'],
+        args.metrics_textfile if args.metrics_textfile is not None else config['Settings']['metrics_textfile']
+    )
+    if not (args.batch or args.mirror is not None or args.watch or args.rebuild_index or args.verify or args.export or args.query is not None):
+        # The GUI toolkit is only imported when the GUI is actually started
+        from .gui import run_gui
+        run_gui()
+        return 0
+
+    # Command-line options override config.ini without changing it
+    output_directory = args.output or config['Settings']['output_directory']
+    index_path = get_index_path(output_directory)
+
+    if args.rebuild_index:
+        indexed = rebuild_index(output_directory, index_path)
+        print(f"Indexed {indexed} cards into {index_path}")
+        return 0
+
+    if args.verify:
+        return 1 if run_verify(output_directory) else 0
+
+    if args.export:
+        run_export(output_directory, args.export)
+        return 0
+
+    if args.query is not None:
+        try:
+            rows = search_index(index_path, args.query, args.tag, args.min_rating, args.max_tokens, args.limit)
+        except sqlite3.OperationalError as err:
+            print(f"Invalid query: {err}", file=sys.stderr)
+            return 2
+        print_index_results(rows)
+        return 0
+
+    bundle_option = args.bundle or config['Settings']['bundle_option']
+    api_token = (args.token if args.token is not None else config['Settings']['api_token']).strip()
+    if args.max_gallery_images is not None:
+        max_gallery_images = args.max_gallery_images
+    else:
+        max_gallery_images = get_int_setting('max_gallery_images', minimum=0)
+
+    if args.watch:
+        failures = run_watch(output_directory, bundle_option, api_token, max_gallery_images, args.once)
+    elif args.mirror is not None:
+        failures = run_mirror(args, output_directory, bundle_option, api_token, max_gallery_images)
+    elif args.batch == '-':
+        failures = run_batch(sys.stdin, output_directory, bundle_option, api_token, max_gallery_images)
+    else:
+        with open(args.batch, encoding='utf-8') as card_source:
+            failures = run_batch(card_source, output_directory, bundle_option, api_token, max_gallery_images)
+    return 1 if failures else 0
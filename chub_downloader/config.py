@@ -0,0 +1,80 @@
+import configparser
+import os
+
+# Configuration file, relative to the working directory
+config_file = 'config.ini'
+
+# Default value of every setting
+default_settings = {
+    'bundle_option': 'Folder',
+    'output_directory': '',
+    'api_token': '',
+    'gallery_workers': '8',
+    'max_gallery_images': '0',
+    'index_database': '',
+    'search_cache_size': '256',
+    'search_cache_ttl': '600',
+    'max_retries': '5',
+    'max_concurrent_requests': '8',
+    'search_concurrency': '4',
+    'download_concurrency': '4',
+    'max_inflight_mb': '256',
+    'max_inflight_files': '16',
+    'min_free_space_mb': '256',
+    'shared_stylesheet': 'no',
+    'deduplicate_gallery': 'no',
+    'download_versions': 'no',
+    'export_workers': '0',
+    'watch_creators': '',
+    'watch_tags': '',
+    'watch_queries': '',
+    'watch_interval': '900',
+    'event_log': '',
+    'metrics_textfile': '',
+    'api_base_url': 'https://api.chub.ai'
+}
+
+# Settings start out as the defaults; load_config() reads config.ini over them
+config = configparser.ConfigParser()
+config['Settings'] = default_settings
+
+def load_config():
+    """
+    Loads config.ini, creating it with the default settings if it doesn't exist.
+    Only the GUI and command line call this, so importing the library touches no files.
+    """
+    if not os.path.exists(config_file):
+        config['Settings'] = default_settings
+        save_config()
+    else:
+        config.read(config_file)
+        # Ensure all settings are present
+        for key, value in default_settings.items():
+            if key not in config['Settings']:
+                config['Settings'][key] = value
+    return config
+
+def save_config():
+    with open(config_file, 'w') as configfile:
+        config.write(configfile)
+
+def get_int_setting(name, minimum=None):
+    """
+    Returns an integer setting, falling back to its default if it isn't a valid number.
+    """
+    try:
+        value = config['Settings'].getint(name, fallback=int(default_settings[name]))
+    except ValueError:
+        value = int(default_settings[name])
+    if minimum is not None:
+        value = max(minimum, value)
+    return value
+
+def get_bool_setting(name):
+    """
+    Returns a yes/no setting, falling back to its default if it isn't a valid boolean.
+    """
+    try:
+        return config['Settings'].getboolean(name, fallback=default_settings[name] == 'yes')
+    except ValueError:
+        return default_settings[name] == 'yes'
@@ -0,0 +1,284 @@
+import json
+import os
+import struct
+import time
+import zlib
+from collections import deque
+
+from .bundle import download_chunk_size, precompressed_extensions
+from .journal import journal_file_name
+
+# Name of the member listing every file of an export, written last
+export_manifest_name = 'export_manifest.json'
+
+# Compression level of the deflated members
+export_compress_level = 6
+
+# Compressible files handed to a worker at once, up to this many bytes
+export_batch_files = 64
+export_batch_bytes = 4 * 1024 * 1024
+
+# Batches waiting to be written, per worker; bounds the memory they take
+export_queue_depth = 4
+
+# Sizes, offsets and counts from these limits on are stored in ZIP64 records
+zip64_limit = 0xFFFFFFFF
+zip64_count_limit = 0xFFFF
+
+# Field values that mean "see the ZIP64 record"
+zip64_marker = 0xFFFFFFFF
+zip64_count_marker = 0xFFFF
+
+# Bit 11 marks UTF-8 member names
+utf8_flag = 0x800
+
+def compress_members(paths, level=export_compress_level):
+    """
+    Deflates a batch of files for the archive; runs in a worker process.
+    Returns a (data, crc32, size, deflated) tuple per file, as compress_member_data does.
+    """
+    results = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            results.append(compress_member_data(f.read(), level))
+    return results
+
+def compress_member_data(data, level=export_compress_level):
+    """
+    Deflates data for the archive. Returns (data, crc32, size, deflated);
+    data that doesn't shrink is returned as it is.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) < len(data):
+        return compressed, zlib.crc32(data), len(data), True
+    return data, zlib.crc32(data), len(data), False
+
+def dos_date_time(timestamp):
+    """
+    Returns the (date, time) fields a zip header uses for a modification time.
+    """
+    local_time = time.localtime(timestamp)
+    if local_time.tm_year < 1980:
+        return (1 << 5) | 1, 0
+    date = ((local_time.tm_year - 1980) << 9) | (local_time.tm_mon << 5) | local_time.tm_mday
+    return date, (local_time.tm_hour << 11) | (local_time.tm_min << 5) | (local_time.tm_sec // 2)
+
+class ArchiveWriter:
+    """
+    Writes a zip archive whose members arrive already compressed, which zipfile can't do,
+    so the compression can happen in other processes. Uses ZIP64 where sizes, offsets or
+    the member count need it, so multi-GB libraries export into one archive.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.entries = []
+
+    def write_header(self, name, deflated, crc, size, compressed_size, timestamp):
+        """
+        Writes a member's local header and records its central directory entry.
+        Returns the header's offset.
+        """
+        offset = self.file.tell()
+        encoded_name = name.encode('utf-8')
+        zip64 = size >= zip64_limit or compressed_size >= zip64_limit
+        extra = struct.pack('<HHQQ', 1, 16, size, compressed_size) if zip64 else b''
+        date, clock = dos_date_time(timestamp)
+        self.file.write(struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, utf8_flag, 8 if deflated else 0, clock, date,
+            crc, zip64_marker if zip64 else compressed_size, zip64_marker if zip64 else size,
+            len(encoded_name), len(extra)
+        ))
+        self.file.write(encoded_name + extra)
+        self.entries.append({
+            'name': encoded_name, 'deflated': deflated, 'crc': crc, 'size': size,
+            'compressed_size': compressed_size, 'date': date, 'time': clock, 'offset': offset
+        })
+        return offset
+
+    def write_member(self, name, data, crc, size, deflated, timestamp):
+        """
+        Adds a member whose (possibly deflated) data is already in memory.
+        """
+        self.write_header(name, deflated, crc, size, len(data), timestamp)
+        self.file.write(data)
+
+    def write_file(self, name, path, timestamp):
+        """
+        Adds a file as-is, streaming it from disk. The CRC is computed on the way and
+        patched into the header afterwards, so the file is only read once.
+        """
+        size = os.path.getsize(path)
+        offset = self.write_header(name, False, 0, size, size, timestamp)
+        crc = 0
+        copied = 0
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(download_chunk_size), b''):
+                crc = zlib.crc32(chunk, crc)
+                copied += len(chunk)
+                self.file.write(chunk)
+        if copied != size:
+            raise OSError(f"{path} changed size while it was exported")
+        end = self.file.tell()
+        self.file.seek(offset + 14)
+        self.file.write(struct.pack('<I', crc))
+        self.file.seek(end)
+        self.entries[-1]['crc'] = crc
+
+    def close(self):
+        """
+        Writes the central directory and closes the archive.
+        """
+        directory_offset = self.file.tell()
+        for entry in self.entries:
+            fields = []
+            if entry['size'] >= zip64_limit:
+                fields.append(entry['size'])
+            if entry['compressed_size'] >= zip64_limit:
+                fields.append(entry['compressed_size'])
+            if entry['offset'] >= zip64_limit:
+                fields.append(entry['offset'])
+            extra = struct.pack(f'<HH{len(fields)}Q', 1, 8 * len(fields), *fields) if fields else b''
+            self.file.write(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, 45, 45 if fields else 20, utf8_flag,
+                8 if entry['deflated'] else 0, entry['time'], entry['date'], entry['crc'],
+                zip64_marker if entry['compressed_size'] >= zip64_limit else entry['compressed_size'],
+                zip64_marker if entry['size'] >= zip64_limit else entry['size'],
+                len(entry['name']), len(extra), 0, 0, 0, 0,
+                zip64_marker if entry['offset'] >= zip64_limit else entry['offset']
+            ))
+            self.file.write(entry['name'] + extra)
+        directory_end = self.file.tell()
+        directory_size = directory_end - directory_offset
+        count = len(self.entries)
+        zip64 = count >= zip64_count_limit or directory_offset >= zip64_limit or directory_size >= zip64_limit
+        if zip64:
+            self.file.write(struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, directory_size, directory_offset
+            ))
+            self.file.write(struct.pack('<IIQI', 0x07064b50, 0, directory_end, 1))
+        self.file.write(struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, zip64_count_marker if zip64 else count, zip64_count_marker if zip64 else count,
+            zip64_marker if zip64 else directory_size, zip64_marker if zip64 else directory_offset, 0
+        ))
+        self.file.close()
+
+def list_library_files(output_directory, skip_paths=()):
+    """
+    Yields (member name, path) for every file of a library, in a stable order.
+    Hidden entries (the blob store; card folders already hold its images), the download
+    journal, unfinished downloads and skip_paths are left out.
+    """
+    skip_paths = {os.path.abspath(path) for path in skip_paths}
+    for folder, folder_names, file_names in os.walk(output_directory):
+        folder_names[:] = sorted(name for name in folder_names if not name.startswith('.'))
+        for file_name in sorted(file_names):
+            path = os.path.join(folder, file_name)
+            if (file_name.startswith('.') or file_name.endswith('.part') or file_name == journal_file_name
+                    or os.path.abspath(path) in skip_paths):
+                continue
+            yield os.path.relpath(path, output_directory).replace(os.sep, '/'), path
+
+def export_library(output_directory, archive_path, workers=0):
+    """
+    Packs a whole output directory (card folders, per-card zip archives and the index)
+    into one zip archive. Compressible files are deflated across a pool of worker
+    processes (workers, 0 for one per CPU) while images and zip archives are stored as-is.
+    The archive ends with export_manifest.json, listing every member.
+    Returns a summary with the counts, sizes and seconds taken.
+    """
+    start_time = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    temp_path = f"{archive_path}.part"
+    archive = ArchiveWriter(temp_path)
+    members = []
+    # Members waiting to be written, in archive order: (name, path, timestamp, batch, index in batch)
+    pending = deque()
+    # Batch of compressible files still being filled
+    open_batch = None
+
+    def submit(batch):
+        if executor is None:
+            batch['results'] = compress_members(batch['paths'])
+        else:
+            batch['future'] = executor.submit(compress_members, batch['paths'])
+
+    def write_next():
+        name, path, timestamp, batch, index = pending.popleft()
+        if batch is None:
+            archive.write_file(name, path, timestamp)
+        else:
+            if 'results' not in batch:
+                if 'future' not in batch:
+                    submit(batch)
+                if 'results' not in batch:
+                    batch['results'] = batch['future'].result()
+            data, crc, size, deflated = batch['results'][index]
+            # Free each member's data once it's written
+            batch['results'][index] = None
+            archive.write_member(name, data, crc, size, deflated, timestamp)
+        entry = archive.entries[-1]
+        members.append({
+            'name': name,
+            'size': entry['size'],
+            'compressed_size': entry['compressed_size'],
+            'crc32': f"{entry['crc']:08x}",
+            'deflated': entry['deflated']
+        })
+
+    # One worker compresses in this process; a pool only pays off with several CPUs
+    executor = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor  # Loads multiprocessing, so only when a pool is used
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for name, path in list_library_files(output_directory, skip_paths=[archive_path, temp_path]):
+            timestamp = os.path.getmtime(path)
+            if os.path.splitext(name)[1].lower() in precompressed_extensions | {'.zip'}:
+                # Already compressed; written straight from disk when its turn comes
+                pending.append((name, path, timestamp, None, 0))
+                continue
+            if open_batch is None or 'future' in open_batch or 'results' in open_batch:
+                open_batch = {'paths': [], 'bytes': 0}
+            pending.append((name, path, timestamp, open_batch, len(open_batch['paths'])))
+            open_batch['paths'].append(path)
+            open_batch['bytes'] += os.path.getsize(path)
+            # Small files go to the workers in batches, so the hand-off doesn't cost more than the compression
+            if len(open_batch['paths']) >= export_batch_files or open_batch['bytes'] >= export_batch_bytes:
+                submit(open_batch)
+            # Members are written in order; the window keeps the workers busy without
+            # holding the whole library's compressed data in memory
+            while len(pending) > workers * export_queue_depth * export_batch_files:
+                write_next()
+        while pending:
+            write_next()
+
+        # Cards are the top-level folders and zip archives
+        cards = {member['name'].split('/')[0] for member in members if '/' in member['name']}
+        cards.update(member['name'] for member in members if '/' not in member['name'] and member['name'].endswith('.zip'))
+        summary = {
+            'source': os.path.abspath(output_directory),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'cards': len(cards),
+            'files': len(members),
+            'bytes': sum(member['size'] for member in members),
+            'compressed_bytes': sum(member['compressed_size'] for member in members)
+        }
+        manifest = json.dumps(dict(summary, members=members), indent=1).encode('utf-8')
+        data, crc, size, deflated = compress_member_data(manifest)
+        archive.write_member(export_manifest_name, data, crc, size, deflated, time.time())
+        archive.close()
+        os.replace(temp_path, archive_path)
+        if executor is not None:
+            executor.shutdown()
+    except BaseException:
+        archive.file.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    summary['archive_bytes'] = os.path.getsize(archive_path)
+    summary['seconds'] = time.perf_counter() - start_time
+    return summary
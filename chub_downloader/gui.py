@@ -0,0 +1,544 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Import ttkbootstrap and tkinter modules
+import requests
+import ttkbootstrap as ttk
+from ttkbootstrap.constants import *
+from tkinter import messagebox, filedialog
+
+from .config import config, get_int_setting, save_config
+from .metrics import DownloadCancelled, add_listener, cancel_event, progress_stages
+from .pipeline import download_card_node, resolve_card
+from .report import highlight_color
+
+logger = logging.getLogger(__name__)
+
+def set_api_token():
+    """
+    Opens a new window to set the Chub.ai Token with an option to toggle visibility.
+    """
+    def toggle_token_visibility():
+        if token_entry.cget('show') == '':
+            token_entry.config(show='*')
+            eye_button.config(text='👁️')
+        else:
+            token_entry.config(show='')
+            eye_button.config(text='🙈')
+
+    def save_token():
+        token = token_entry.get().strip()
+        config['Settings']['api_token'] = token
+        save_config()
+        token_window.destroy()
+        messagebox.showinfo("Chub.ai Token Saved", "Your Chub.ai token has been saved.")
+
+    # Create a new window
+    token_window = ttk.Toplevel(app)
+    token_window.title("Set Chub.ai Token")
+    token_window.geometry("400x400")  # Updated size as per your request
+    token_window.resizable(False, False)
+
+    # Explanation Label
+    explanation = (
+        "To access NSFL cards or private content, you need to provide your Chub.ai token.\n\n"
+        "How to find your Chub.ai token:\n"
+        "1. Open your web browser and go to chub.ai.\n"
+        "2. Log in to your account.\n"
+        "3. Open the browser's developer tools (usually by pressing F12).\n"
+        "4. Go to the 'Application' (or 'Storage') tab.\n"
+        "5. Look for 'Local Storage' and find the key 'URQL_TOKEN'.\n"
+        "6. Copy the value of 'URQL_TOKEN' and paste it below."
+    )
+    label = ttk.Label(token_window, text=explanation, wraplength=380, justify=LEFT)
+    label.pack(pady=10, padx=10)
+
+    # Token Entry Frame
+    token_frame = ttk.Frame(token_window)
+    token_frame.pack(pady=(0, 10), padx=10, fill=X)
+
+    # Token Entry Label
+    token_label = ttk.Label(token_frame, text="Chub.ai Token:")
+    token_label.pack(side=LEFT, pady=(10, 5))
+
+    # Token Entry
+    token_entry = ttk.Entry(token_frame, show='*')
+    token_entry.insert(0, config['Settings']['api_token'])
+    token_entry.pack(side=LEFT, fill=X, expand=YES, pady=(10, 5))
+
+    # Eye Button to Toggle Visibility
+    eye_button = ttk.Button(token_frame, text='👁️', width=2, command=toggle_token_visibility)
+    eye_button.pack(side=LEFT, padx=(5, 0), pady=(10, 5))
+
+    # Save Button
+    save_button = ttk.Button(token_window, text="Save Token", command=save_token, style='Custom.TButton')
+    save_button.pack(pady=(0, 10))
+
+# Messages from worker threads for the Tk main loop: metrics events (dicts) and
+# (function, args) calls. Tk is only ever touched from the main thread.
+ui_queue = queue.Queue()
+
+# Every card in the download queue by row id, in the order they were added
+download_items = {}
+
+# Items added since the last summary, reported together once the queue is idle
+summary_items = []
+
+# Cards being downloaded right now, so the same card isn't downloaded twice at once
+active_cards = set()
+active_cards_lock = threading.Lock()
+
+# Display names of the item statuses
+status_labels = {
+    'queued': "Queued",
+    'running': "Downloading",
+    'ok': "Done",
+    'skipped': "Skipped",
+    'choose': "Pick a match",
+    'failed': "Failed",
+    'cancelled': "Cancelled"
+}
+
+# Statuses an item can't leave on its own
+finished_statuses = ('ok', 'skipped', 'choose', 'failed', 'cancelled')
+
+def post_to_ui(function, *args):
+    """
+    Runs function(*args) on the Tk main thread.
+    """
+    ui_queue.put((function, args))
+
+def new_item(name, bundle_option, output_directory, node=None):
+    """
+    Returns a download queue item for a card name (or a node picked from the search results).
+    """
+    return {
+        'id': None,
+        'name': name,
+        'node': node,
+        'bundle_option': bundle_option,
+        'output_directory': output_directory,
+        'card': None,
+        'status': 'queued',
+        'message': '',
+        'steps': 0,
+        'planned': 0,
+        'bytes': 0,
+        'start_time': None,
+        'cancel': threading.Event(),
+        'future': None
+    }
+
+def submit_item(item):
+    """
+    Resets an item and hands it to the worker pool.
+    """
+    item.update(status='queued', message='', card=None, steps=0, planned=0, bytes=0, start_time=None,
+                cancel=threading.Event())
+    if item not in summary_items:
+        summary_items.append(item)
+    update_row(item)
+    item['future'] = download_pool.submit(download_item_thread, item)
+
+def download_item_thread(item):
+    """
+    Downloads one queue item on a worker thread. Feedback goes through the UI queue,
+    so this thread never touches Tk.
+    """
+    if item['cancel'].is_set():
+        post_to_ui(finish_item, item, 'cancelled', "Cancelled before it started.")
+        return
+    post_to_ui(start_item, item)
+
+    cancel_token = cancel_event.set(item['cancel'])
+    full_path = None
+    try:
+        api_token = config['Settings'].get('api_token', '').strip()
+        max_gallery_images = get_int_setting('max_gallery_images', minimum=0)
+        node = item['node']
+        if node is None:
+            node, result = resolve_card(item['name'], item['output_directory'], api_token)
+            if node is None:
+                if result['reason'] == 'multiple_results':
+                    # Let the user pick one of the cached matches; the chooser opens first
+                    # so finishing the item doesn't show the summary over it
+                    post_to_ui(choose_card, result['candidates'], item)
+                    post_to_ui(finish_item, item, 'choose', result['message'])
+                else:
+                    post_to_ui(finish_item, item, result['status'], result['message'])
+                return
+
+        with active_cards_lock:
+            if node['fullPath'] in active_cards:
+                post_to_ui(finish_item, item, 'skipped', "The same card is already being downloaded.")
+                return
+            active_cards.add(node['fullPath'])
+            full_path = node['fullPath']
+        # The metrics events of this card carry its fullPath
+        item['card'] = full_path
+
+        result = download_card_node(node, item['output_directory'], item['bundle_option'], api_token, max_gallery_images)
+        message = result['message']
+        if result['status'] == 'ok' and result['gallery_count'] == 0:
+            message += " No gallery images found."
+        post_to_ui(finish_item, item, result['status'], message)
+
+    except DownloadCancelled:
+        if item['bundle_option'] == 'Zip':
+            # An unfinished archive can't be reopened
+            message = "Cancelled; retrying starts the card over."
+        else:
+            message = "Cancelled; retrying continues where it stopped."
+        post_to_ui(finish_item, item, 'cancelled', message)
+    except requests.exceptions.HTTPError as http_err:
+        logger.error(f"HTTP error occurred: {http_err}")
+        post_to_ui(finish_item, item, 'failed', f"An HTTP error occurred: {http_err}")
+    except Exception as err:
+        logger.error(f"An error occurred: {err}")
+        post_to_ui(finish_item, item, 'failed', f"An error occurred: {err}")
+    finally:
+        cancel_event.reset(cancel_token)
+        if full_path is not None:
+            with active_cards_lock:
+                active_cards.discard(full_path)
+
+def start_item(item):
+    if item['status'] == 'queued':
+        item['status'] = 'running'
+        item['start_time'] = time.perf_counter()
+        update_row(item)
+
+def finish_item(item, status, message):
+    """
+    Records the outcome of an item and shows the summary once the queue is idle.
+    """
+    item['status'] = status
+    item['message'] = message
+    update_row(item)
+    show_summary_if_idle()
+
+def show_summary_if_idle():
+    """
+    Shows the summary unless items are still queued, running or have their chooser open,
+    so it never opens alongside a chooser window.
+    """
+    if not any(other['status'] in ('queued', 'running') or other.get('choosing') for other in download_items.values()):
+        show_summary()
+
+def show_summary():
+    """
+    Shows one dialog summing up the items finished since the last summary.
+    """
+    if not summary_items:
+        return
+    counts = {}
+    for item in summary_items:
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+    lines = [f"{status_labels[status]}: {counts[status]}" for status in finished_statuses if status in counts]
+    failed = [item for item in summary_items if item['status'] == 'failed']
+    if failed:
+        lines.append('')
+        lines += [f"{item['name']}: {item['message']}" for item in failed[:5]]
+        if len(failed) > 5:
+            lines.append(f"... and {len(failed) - 5} more")
+    summary_items.clear()
+    status_var.set("Ready")
+    progress_var.set(0)
+    messagebox.showinfo("Downloads Finished", '\n'.join(lines))
+
+def update_row(item):
+    """
+    Shows an item's current state in its row of the queue table.
+    """
+    percent = ''
+    details = item['message']
+    if item['status'] == 'running':
+        if item['planned']:
+            percent = f"{min(100, 100 * item['steps'] / item['planned']):.0f}%"
+        elapsed = time.perf_counter() - item['start_time']
+        rate = item['bytes'] / elapsed if elapsed > 0 else 0
+        details = f"{item['bytes'] / 1024 / 1024:.1f} MB at {rate / 1024 / 1024:.2f} MB/s"
+    elif item['status'] == 'ok':
+        percent = "100%"
+    queue_tree.item(item['id'], values=(item['name'], status_labels[item['status']], percent, details))
+
+def apply_event(event):
+    """
+    Updates the progress of the running item a metrics event belongs to.
+    """
+    for item in download_items.values():
+        if item['status'] == 'running' and item['card'] is not None and item['card'] == event.get('card'):
+            break
+    else:
+        return
+    if event['event'] == 'progress':
+        item['bytes'] += event['bytes']
+    elif event['event'] == 'plan':
+        item['planned'] = event['steps']
+    elif event['event'] == 'stage' and event['stage'] in progress_stages:
+        item['steps'] += 1
+
+def process_ui_queue():
+    """
+    Drains the UI queue on the main thread and refreshes the running rows and the status bar.
+    """
+    while True:
+        try:
+            message = ui_queue.get_nowait()
+        except queue.Empty:
+            break
+        if isinstance(message, dict):
+            apply_event(message)
+        else:
+            function, args = message
+            function(*args)
+
+    running = [item for item in summary_items if item['status'] == 'running']
+    for item in running:
+        update_row(item)
+    if summary_items:
+        # Share of the queue that is done, counting running items by their progress
+        done = sum(1 for item in summary_items if item['status'] in finished_statuses)
+        done += sum(item['steps'] / item['planned'] for item in running if item['planned'])
+        progress_var.set(100 * min(1, done / len(summary_items)))
+        queued = sum(1 for item in summary_items if item['status'] == 'queued')
+        status_var.set(f"Downloading {len(running)}, {queued} queued, {int(done)} of {len(summary_items)} done")
+    app.after(100, process_ui_queue)
+
+def add_to_queue():
+    """
+    Adds every card name in the text box (one per line) to the download queue.
+    """
+    names = [line.strip() for line in entry.get('1.0', END).splitlines()]
+    names = [name for name in names if name and not name.startswith('#')]
+    output_directory = output_dir.get()
+
+    if not names:
+        messagebox.showwarning("Input Error", "Please enter the name of the card.")
+        return
+
+    if not output_directory:
+        messagebox.showwarning("Output Directory Not Set", "Please select an output directory.")
+        return
+
+    for name in names:
+        add_item(new_item(name, var.get(), output_directory))
+    entry.delete('1.0', END)
+
+def add_item(item):
+    item['id'] = queue_tree.insert('', END, values=(item['name'], '', '', ''))
+    download_items[item['id']] = item
+    submit_item(item)
+
+def cancel_selected():
+    """
+    Cancels the selected queued or running items.
+    """
+    for row_id in queue_tree.selection():
+        item = download_items[row_id]
+        if item['status'] not in ('queued', 'running'):
+            continue
+        item['cancel'].set()
+        if item['future'] is not None and item['future'].cancel():
+            # It hadn't started yet, so no worker will report it
+            finish_item(item, 'cancelled', "Cancelled before it started.")
+
+def retry_selected():
+    """
+    Queues the selected failed or cancelled items again.
+    """
+    for row_id in queue_tree.selection():
+        item = download_items[row_id]
+        if item['status'] in ('failed', 'cancelled'):
+            submit_item(item)
+
+def clear_finished():
+    """
+    Removes the finished items from the queue table.
+    """
+    for row_id, item in list(download_items.items()):
+        if item['status'] in finished_statuses and item['status'] != 'choose' and item not in summary_items:
+            queue_tree.delete(row_id)
+            del download_items[row_id]
+
+def close_app():
+    """
+    Cancels every download and closes the window without waiting for the workers.
+    """
+    for item in download_items.values():
+        item['cancel'].set()
+    download_pool.shutdown(wait=False, cancel_futures=True)
+    app.destroy()
+
+def choose_card(nodes, item):
+    """
+    Opens a window listing the cards that matched an item's search, so one can be downloaded directly.
+    """
+    def download_selected(*args):
+        selection = tree.selection()
+        if not selection:
+            return
+        item['node'] = nodes[int(selection[0])]
+        item['name'] = item['node'].get('fullPath', item['name'])
+        item['choosing'] = False
+        chooser_window.destroy()
+        submit_item(item)
+
+    def close_chooser():
+        # Closed without a choice: the item stays a pick-a-match and the summary can show
+        item['choosing'] = False
+        chooser_window.destroy()
+        show_summary_if_idle()
+
+    # Create a new window
+    item['choosing'] = True
+    chooser_window = ttk.Toplevel(app)
+    chooser_window.protocol('WM_DELETE_WINDOW', close_chooser)
+    chooser_window.title(f"Multiple Results for {item['name']}")
+    chooser_window.geometry("600x400")
+
+    label = ttk.Label(chooser_window, text=f"{len(nodes)} cards found. Select the one to download:")
+    label.pack(pady=10, padx=10, anchor=W)
+
+    # List of matching cards
+    tree = ttk.Treeview(chooser_window, columns=('name', 'full_path', 'rating'), show='headings', selectmode='browse')
+    tree.heading('name', text="Name")
+    tree.heading('full_path', text="Full Path")
+    tree.heading('rating', text="Rating")
+    tree.column('rating', width=60, stretch=False)
+    for index, node in enumerate(nodes):
+        tree.insert('', END, iid=str(index), values=(node.get('name', ''), node.get('fullPath', ''), node.get('rating', '')))
+    tree.pack(fill=BOTH, expand=YES, padx=10)
+    tree.bind('<Double-1>', download_selected)
+
+    # Download Button
+    select_button = ttk.Button(chooser_window, text="Download Selected", command=download_selected, style='Custom.TButton')
+    select_button.pack(pady=10)
+
+def run_gui():
+    """
+    Builds the main window and runs the Tk event loop.
+    """
+    global app, entry, var, output_dir, queue_tree, status_var, progress_var, download_pool
+
+    # Cards download in parallel up to download_concurrency; the rest wait in the queue
+    download_pool = ThreadPoolExecutor(max_workers=get_int_setting('download_concurrency', minimum=1))
+
+    # GUI Setup
+    app = ttk.Window(
+        title="Chub.ai Card Downloader",
+        themename="journal"
+    )
+    app.geometry("700x550")  # Room for the download queue
+
+    style = ttk.Style()
+    style.configure('TLabel', font=('Segoe UI', 11))
+    style.configure('TEntry', font=('Segoe UI', 11))
+    style.configure('TCombobox', font=('Segoe UI', 11))
+    style.configure('Custom.TButton', font=('Segoe UI', 11), foreground='white', background=highlight_color)
+    style.map('Custom.TButton',
+              background=[('active', highlight_color)],
+              foreground=[('active', 'white')])
+
+    # Remove the red border around buttons
+    style.configure('Custom.TButton', borderwidth=0)
+    style.configure('TCombobox', fieldbackground='white')
+
+    # Main Frame
+    frame = ttk.Frame(app, padding=10)
+    frame.pack(fill=BOTH, expand=YES)
+
+    # Use grid layout for better control
+    frame.columnconfigure(1, weight=1)
+    frame.rowconfigure(6, weight=1)
+
+    # Card Names, one per line
+    label = ttk.Label(frame, text="Card Names:")
+    label.grid(row=0, column=0, sticky=NW, pady=(5, 5))
+
+    entry = ttk.Text(frame, height=4, font=('Segoe UI', 11))
+    entry.grid(row=0, column=1, sticky=EW, pady=(5, 5), columnspan=2)
+
+    # Bundle Option
+    option_label = ttk.Label(frame, text="Bundle As:")
+    option_label.grid(row=1, column=0, sticky=W, pady=(5, 5))
+
+    var = ttk.StringVar(value=config['Settings']['bundle_option'])
+
+    options = ['Folder', 'Zip']
+    option_menu = ttk.Combobox(frame, textvariable=var, values=options, state='readonly', width=10)
+    option_menu.grid(row=1, column=1, sticky=W, pady=(5, 5))
+    option_menu.current(options.index(config['Settings']['bundle_option']))
+
+    def on_option_change(*args):
+        config['Settings']['bundle_option'] = var.get()
+        save_config()
+
+    var.trace_add('write', on_option_change)
+
+    # Output Directory
+    output_label = ttk.Label(frame, text="Output Directory:")
+    output_label.grid(row=2, column=0, sticky=W, pady=(5, 5))
+
+    output_dir = ttk.StringVar(value=config['Settings']['output_directory'])
+
+    output_dir_entry = ttk.Entry(frame, textvariable=output_dir, state='readonly')
+    output_dir_entry.grid(row=2, column=1, sticky=EW, pady=(5, 5))
+
+    def select_output_directory():
+        directory = filedialog.askdirectory(title="Select Output Directory")
+        if directory:
+            output_dir.set(directory)
+            config['Settings']['output_directory'] = directory
+            save_config()
+
+    select_output_button = ttk.Button(frame, text="Browse", command=select_output_directory, style='Custom.TButton')
+    select_output_button.grid(row=2, column=2, sticky=W, padx=(5, 0), pady=(5, 5))
+
+    # Set Chub.ai Token Button
+    token_button = ttk.Button(frame, text="Set Chub.ai Token", command=set_api_token, style='Custom.TButton')
+    token_button.grid(row=3, column=0, columnspan=3, sticky=EW, pady=(10, 0))
+
+    # Add to Queue Button
+    download_button = ttk.Button(frame, text="Add to Queue", command=add_to_queue, style='Custom.TButton')
+    download_button.grid(row=4, column=0, columnspan=3, sticky=EW, pady=(10, 0))
+
+    # Queue Buttons
+    queue_buttons = ttk.Frame(frame)
+    queue_buttons.grid(row=5, column=0, columnspan=3, sticky=EW, pady=(10, 5))
+    for text, command in (("Cancel", cancel_selected), ("Retry", retry_selected), ("Clear Finished", clear_finished)):
+        ttk.Button(queue_buttons, text=text, command=command, style='Custom.TButton').pack(side=LEFT, padx=(0, 5))
+
+    # Download Queue, one row per card
+    queue_frame = ttk.Frame(frame)
+    queue_frame.grid(row=6, column=0, columnspan=3, sticky=NSEW)
+    queue_tree = ttk.Treeview(queue_frame, columns=('card', 'status', 'progress', 'details'), show='headings')
+    queue_tree.heading('card', text="Card")
+    queue_tree.heading('status', text="Status")
+    queue_tree.heading('progress', text="Progress")
+    queue_tree.heading('details', text="Details")
+    queue_tree.column('status', width=100, stretch=False)
+    queue_tree.column('progress', width=70, stretch=False)
+    scrollbar = ttk.Scrollbar(queue_frame, orient=VERTICAL, command=queue_tree.yview)
+    queue_tree.configure(yscrollcommand=scrollbar.set)
+    scrollbar.pack(side=RIGHT, fill=Y)
+    queue_tree.pack(side=LEFT, fill=BOTH, expand=YES)
+
+    # Status Bar
+    status_var = ttk.StringVar(value="Ready")
+    status_bar = ttk.Label(app, textvariable=status_var, relief=SUNKEN, anchor=W, font=('Segoe UI', 10))
+    status_bar.pack(side=BOTTOM, fill=X)
+
+    # Progress Bar over the whole queue, fed by the metrics events of the running downloads
+    progress_var = ttk.DoubleVar(value=0)
+    progress_bar = ttk.Progressbar(app, variable=progress_var, maximum=100)
+    progress_bar.pack(side=BOTTOM, fill=X, padx=10, pady=(0, 5))
+    add_listener(ui_queue.put)
+    app.after(100, process_ui_queue)
+    app.protocol('WM_DELETE_WINDOW', close_app)
+
+    # Run the application
+    app.mainloop()
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import re  # Import regular expressions module
+import sqlite3
+import zipfile
+
+from .bundle import manifest_file_name
+from .config import config
+from .report import parse_token_counts
+
+logger = logging.getLogger(__name__)
+
+# Name of the SQLite card index kept in the output directory
+index_file_name = 'chub_library.db'
+
+def get_index_path(output_directory):
+    """
+    Returns the path of the card index database for an output directory.
+    """
+    index_database = config['Settings'].get('index_database', '').strip()
+    return index_database or os.path.join(output_directory, index_file_name)
+
+def open_index(index_path):
+    """
+    Opens the card index database, creating its tables if needed.
+    """
+    connection = sqlite3.connect(index_path)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS cards (
+            id INTEGER PRIMARY KEY,
+            full_path TEXT,
+            name TEXT,
+            tagline TEXT,
+            description TEXT,
+            tags TEXT,
+            token_count INTEGER,
+            star_count INTEGER,
+            rating REAL,
+            rating_count INTEGER,
+            n_chats INTEGER,
+            created_at TEXT,
+            last_activity_at TEXT,
+            path TEXT,
+            node TEXT
+        );
+        CREATE TABLE IF NOT EXISTS card_tags (
+            card_id INTEGER NOT NULL REFERENCES cards(id) ON DELETE CASCADE,
+            tag TEXT NOT NULL COLLATE NOCASE,
+            PRIMARY KEY (card_id, tag)
+        );
+        CREATE INDEX IF NOT EXISTS card_tags_tag ON card_tags(tag);
+        CREATE INDEX IF NOT EXISTS cards_rating ON cards(rating);
+        CREATE INDEX IF NOT EXISTS cards_token_count ON cards(token_count);
+        CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(
+            name, tagline, description, tags, content='cards', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS cards_fts_insert AFTER INSERT ON cards BEGIN
+            INSERT INTO cards_fts(rowid, name, tagline, description, tags)
+            VALUES (new.id, new.name, new.tagline, new.description, new.tags);
+        END;
+        CREATE TRIGGER IF NOT EXISTS cards_fts_delete AFTER DELETE ON cards BEGIN
+            INSERT INTO cards_fts(cards_fts, rowid, name, tagline, description, tags)
+            VALUES ('delete', old.id, old.name, old.tagline, old.description, old.tags);
+        END;
+        CREATE TRIGGER IF NOT EXISTS cards_fts_update AFTER UPDATE ON cards BEGIN
+            INSERT INTO cards_fts(cards_fts, rowid, name, tagline, description, tags)
+            VALUES ('delete', old.id, old.name, old.tagline, old.description, old.tags);
+            INSERT INTO cards_fts(rowid, name, tagline, description, tags)
+            VALUES (new.id, new.name, new.tagline, new.description, new.tags);
+        END;
+    """)
+    connection.execute('PRAGMA foreign_keys = ON')
+    return connection
+
+def upsert_card(connection, node, card_path):
+    """
+    Inserts or updates a search node in the card index.
+    """
+    topics = node.get('topics') or []
+    connection.execute("""
+        INSERT INTO cards (id, full_path, name, tagline, description, tags, token_count, star_count,
+                           rating, rating_count, n_chats, created_at, last_activity_at, path, node)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            full_path = excluded.full_path, name = excluded.name, tagline = excluded.tagline,
+            description = excluded.description, tags = excluded.tags, token_count = excluded.token_count,
+            star_count = excluded.star_count, rating = excluded.rating, rating_count = excluded.rating_count,
+            n_chats = excluded.n_chats, created_at = excluded.created_at,
+            last_activity_at = excluded.last_activity_at, path = excluded.path, node = excluded.node
+    """, (
+        node['id'],
+        node.get('fullPath'),
+        node.get('name'),
+        node.get('tagline'),
+        node.get('description'),
+        ', '.join(topics),
+        parse_token_counts(node).get('total'),
+        node.get('starCount'),
+        node.get('rating'),
+        node.get('ratingCount'),
+        node.get('nChats'),
+        node.get('createdAt'),
+        node.get('lastActivityAt'),
+        card_path,
+        json.dumps(node)
+    ))
+    connection.execute('DELETE FROM card_tags WHERE card_id = ?', (node['id'],))
+    connection.executemany(
+        'INSERT OR IGNORE INTO card_tags (card_id, tag) VALUES (?, ?)',
+        [(node['id'], topic) for topic in topics]
+    )
+
+def index_card(index_path, node, card_path):
+    """
+    Records a downloaded card in the card index.
+    """
+    connection = open_index(index_path)
+    try:
+        with connection:
+            upsert_card(connection, node, card_path)
+    finally:
+        connection.close()
+
+def search_index(index_path, text='', tags=(), min_rating=None, max_tokens=None, limit=50):
+    """
+    Searches the card index. text is an FTS5 query over name, tagline, description and tags;
+    tags must all be present on a card. Returns a list of row dicts, best matches first.
+    """
+    conditions = []
+    parameters = []
+    if text:
+        conditions.append('cards.id IN (SELECT rowid FROM cards_fts WHERE cards_fts MATCH ?)')
+        parameters.append(text)
+    for tag in tags:
+        conditions.append('cards.id IN (SELECT card_id FROM card_tags WHERE tag = ?)')
+        parameters.append(tag)
+    if min_rating is not None:
+        conditions.append('cards.rating >= ?')
+        parameters.append(min_rating)
+    if max_tokens is not None:
+        conditions.append('cards.token_count <= ?')
+        parameters.append(max_tokens)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    connection = open_index(index_path)
+    connection.row_factory = sqlite3.Row
+    try:
+        rows = connection.execute(f"""
+            SELECT id, full_path, name, tagline, tags, token_count, star_count, rating, path
+            FROM cards {where}
+            ORDER BY rating DESC, star_count DESC
+            LIMIT ?
+        """, parameters + [limit]).fetchall()
+    finally:
+        connection.close()
+    return [dict(row) for row in rows]
+
+def parse_info_html(html_text):
+    """
+    Rebuilds a partial search node from an _info.html report, for cards downloaded
+    before their node was stored in the manifest.
+    """
+    import html  # Only needed when rebuilding the index from old reports
+
+    def text_of(fragment):
+        return html.unescape(re.sub(r'<[^>]+>', '', fragment)).strip()
+
+    info_part, _, token_part = html_text.partition('<div class="info">')[2].partition('class="token-counts"')
+    # Newer reports end with the card definition, whose counts aren't token counts
+    info_part = info_part.partition('class="card-definition"')[0]
+    token_part = token_part.partition('class="card-definition"')[0]
+    fields = {
+        text_of(key): text_of(value)
+        for key, value in re.findall(r'<strong>([^<]*):</strong>\s*<span>(.*?)</span>', info_part, re.S)
+    }
+    name_match = re.search(r'<h1>(.*?)</h1>', html_text, re.S)
+    description_match = re.search(r'<h2>Description</h2>(.*?)</div>\s*<div class="info">', html_text, re.S)
+    token_total = sum(
+        int(value) for value in re.findall(r'<span>(\d+)</span>', token_part)
+    )
+
+    def number(value, cast=int):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    node = {
+        'id': number(fields.get('ID')),
+        'fullPath': fields.get('Full Path'),
+        'name': text_of(name_match.group(1)) if name_match else fields.get('Name'),
+        'tagline': fields.get('Tagline'),
+        'description': text_of(description_match.group(1)) if description_match else '',
+        'topics': [tag for tag in (fields.get('Tags') or '').split(', ') if tag],
+        'starCount': number(fields.get('Downloads')),
+        'rating': number(fields.get('Rating'), float),
+        'ratingCount': number(fields.get('Rating Count')),
+        'nChats': number(fields.get('Chats')),
+        'createdAt': fields.get('Created At'),
+        'lastActivityAt': fields.get('Last Activity'),
+    }
+    if token_total:
+        node['labels'] = [{'title': 'TOKEN_COUNTS', 'description': json.dumps({'total': token_total})}]
+    return node
+
+def read_card_node(card_path):
+    """
+    Reads the search node of a downloaded card folder or zip archive.
+    Returns None if the path does not hold a downloaded card.
+    """
+    if os.path.isdir(card_path):
+        def read_member(file_name):
+            with open(os.path.join(card_path, file_name), encoding='utf-8') as f:
+                return f.read()
+        file_names = os.listdir(card_path)
+    elif card_path.lower().endswith('.zip'):
+        try:
+            with zipfile.ZipFile(card_path) as zip_file:
+                members = {
+                    file_name: zip_file.read(file_name).decode('utf-8')
+                    for file_name in zip_file.namelist()
+                    if file_name == manifest_file_name or file_name.endswith('_info.html')
+                }
+        except zipfile.BadZipFile:
+            return None
+        read_member = members.__getitem__
+        file_names = list(members)
+    else:
+        return None
+
+    if manifest_file_name in file_names:
+        node = json.loads(read_member(manifest_file_name)).get('node')
+        if node:
+            return node
+    for file_name in file_names:
+        if file_name.endswith('_info.html'):
+            node = parse_info_html(read_member(file_name))
+            if node['id'] is not None:
+                return node
+    return None
+
+def rebuild_index(output_directory, index_path):
+    """
+    Backfills the card index from every card folder and zip archive in the output directory.
+    Returns the number of cards indexed.
+    """
+    indexed = 0
+    connection = open_index(index_path)
+    try:
+        with connection:
+            for entry in sorted(os.listdir(output_directory)):
+                card_path = os.path.join(output_directory, entry)
+                try:
+                    node = read_card_node(card_path)
+                except (OSError, UnicodeDecodeError, json.JSONDecodeError) as err:
+                    logger.error(f"Could not read card {card_path}: {err}")
+                    continue
+                if node:
+                    upsert_card(connection, node, card_path)
+                    indexed += 1
+    finally:
+        connection.close()
+    return indexed
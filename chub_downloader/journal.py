@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+
+# Name of the journal that records unfinished downloads in the output directory
+journal_file_name = 'download_journal.jsonl'
+
+# Records reach the OS as they're written, so they survive a crash of the app. A record is
+# also synced to disk if at least this many seconds passed since the last sync, so the
+# records since then may be lost in a power cut and are downloaded again; compacting syncs all
+journal_sync_interval = 1.0
+
+class DownloadJournal:
+    """
+    Append-only record of download progress in an output directory, so an interrupted
+    card or batch continues where it stopped: searches, the card PNG, each gallery image
+    and the validators of partially downloaded files are recorded until the card is bundled.
+    Whenever a card is bundled the file is rewritten with only the unfinished cards' state,
+    so it stays as small as the work in flight, and it's removed once no card is left unfinished.
+    """
+    def __init__(self, journal_path):
+        self.path = journal_path
+        self.searches = {}
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.file = None
+        self.last_sync = 0.0
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.apply(json.loads(line))
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        # A torn line from a crash; everything before it still counts
+                        continue
+            # Drop the history of cards finished before the restart
+            with self.lock:
+                self.compact()
+
+    def apply(self, record):
+        stage = record['stage']
+        if stage == 'searched':
+            self.searches[record['query']] = record['node']
+            return
+        full_path = record['job']
+        if stage == 'bundled':
+            self.jobs.pop(full_path, None)
+            self.searches = {
+                query: node for query, node in self.searches.items() if node.get('fullPath') != full_path
+            }
+            return
+        job_state = self.jobs.setdefault(full_path, {'card': None, 'gallery': {}, 'partial': {}})
+        if stage == 'card':
+            job_state['card'] = record['card']
+            job_state['partial'].pop(record['card']['file'], None)
+        elif stage == 'gallery_item':
+            job_state['gallery'][record['entry']['name']] = record['entry']
+            job_state['partial'].pop(record['entry']['name'], None)
+        elif stage == 'partial':
+            job_state['partial'][record['file']] = record['validator']
+
+    def record(self, record):
+        with self.lock:
+            self.apply(record)
+            if record['stage'] == 'bundled':
+                self.compact()
+                return
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(json.dumps(record) + '\n')
+            # Flushed, so a crash of the process loses nothing
+            self.file.flush()
+            if time.monotonic() - self.last_sync >= journal_sync_interval:
+                os.fsync(self.file.fileno())
+                self.last_sync = time.monotonic()
+
+    def state_records(self):
+        """
+        Returns the records that rebuild the current state: the searches and the steps of unfinished cards.
+        """
+        records = [{'stage': 'searched', 'query': query, 'node': node} for query, node in self.searches.items()]
+        for full_path, job_state in self.jobs.items():
+            if job_state['card']:
+                records.append({'stage': 'card', 'job': full_path, 'card': job_state['card']})
+            for entry in job_state['gallery'].values():
+                records.append({'stage': 'gallery_item', 'job': full_path, 'entry': entry})
+            for file_name, validator in job_state['partial'].items():
+                records.append({'stage': 'partial', 'job': full_path, 'file': file_name, 'validator': validator})
+        return records
+
+    def compact(self):
+        """
+        Rewrites the journal with only the current state, or removes it if nothing is left
+        to resume. Called with the lock held.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if not self.jobs and not self.searches:
+            # Nothing left to resume
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        temp_path = f"{self.path}.part"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for record in self.state_records():
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.last_sync = time.monotonic()
+
+    def searched_node(self, query):
+        with self.lock:
+            return self.searches.get(query)
+
+    def job(self, full_path):
+        return JournalJob(self, full_path)
+
+class JournalJob:
+    """
+    The journal entries of one card, identified by its fullPath.
+    """
+    def __init__(self, journal, full_path):
+        self.journal = journal
+        self.full_path = full_path
+
+    def state(self):
+        with self.journal.lock:
+            job_state = self.journal.jobs.get(self.full_path, {'card': None, 'gallery': {}, 'partial': {}})
+            return {
+                'card': job_state['card'],
+                'gallery': dict(job_state['gallery']),
+                'partial': dict(job_state['partial'])
+            }
+
+    def record_card(self, card):
+        self.journal.record({'stage': 'card', 'job': self.full_path, 'card': card})
+
+    def record_gallery_item(self, entry):
+        self.journal.record({'stage': 'gallery_item', 'job': self.full_path, 'entry': entry})
+
+    def record_partial(self, file_name, validator):
+        self.journal.record({'stage': 'partial', 'job': self.full_path, 'file': file_name, 'validator': validator})
+
+    def finish(self):
+        self.journal.record({'stage': 'bundled', 'job': self.full_path})
+
+# Open download journals by path
+journals = {}
+journals_lock = threading.Lock()
+
+def open_journal(output_directory):
+    """
+    Returns the download journal of an output directory, shared by every download into it.
+    """
+    journal_path = os.path.abspath(os.path.join(output_directory, journal_file_name))
+    with journals_lock:
+        if journal_path not in journals:
+            journals[journal_path] = DownloadJournal(journal_path)
+        return journals[journal_path]
+
+def get_resume_headers(card_writer, job, file_name):
+    """
+    Returns the Range headers that continue a partial download of file_name, or an empty dict.
+    A partial file is only continued if the server can confirm it hasn't changed (If-Range).
+    """
+    offset = card_writer.partial_size(file_name)
+    validator = job.state()['partial'].get(file_name) if offset else None
+    if not validator:
+        return {}
+    return {
+        'Range': f"bytes={offset}-",
+        'If-Range': validator
+    }
+
+def save_download(card_writer, job, file_name, response, digest=None, check=None):
+    """
+    Saves a 200 or 206 response through the card writer, recording the response's
+    validator in the journal first so the download can be resumed if it is interrupted.
+    check, if given, vets the complete file before it's kept (see save_response_atomically).
+    Returns the number of bytes written.
+    """
+    if response.status_code == 200 and card_writer.resumable:
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        # Weak ETags can't be used with If-Range
+        if validator and not validator.startswith('W/'):
+            job.record_partial(file_name, validator)
+    return card_writer.write_response(file_name, response, digest, resume=response.status_code == 206, check=check)
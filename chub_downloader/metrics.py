@@ -0,0 +1,164 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+# Card the running stage belongs to; set per download and carried into the gallery threads
+current_card = contextvars.ContextVar('current_card', default=None)
+
+# Set to a threading.Event to make the current card's download stop; see check_cancelled
+cancel_event = contextvars.ContextVar('cancel_event', default=None)
+
+# Stages that make up a card's progress, planned by a 'plan' event (see download_gallery)
+progress_stages = ('html', 'card', 'image', 'bundle')
+
+# Requests sent by each thread, so a stage can tell how many it needed
+thread_requests = threading.local()
+
+# Callbacks that receive every event, e.g. the GUI's progress queue
+listeners = []
+
+# Per-stage totals for the Prometheus textfile
+stage_totals = {}
+totals_lock = threading.Lock()
+
+# Sinks set up by configure(); nothing is written until then
+event_log = None
+event_log_lock = threading.Lock()
+textfile_path = None
+
+def configure(event_log_path=None, metrics_textfile=None):
+    """
+    Sets where events go: a JSON-lines event log and a Prometheus textfile
+    (for node_exporter's textfile collector). Empty paths turn a sink off.
+    """
+    global event_log, textfile_path
+    with event_log_lock:
+        if event_log is not None:
+            event_log.close()
+            event_log = None
+        if event_log_path:
+            # Line buffered, so each event reaches the file as it happens
+            event_log = open(event_log_path, 'a', encoding='utf-8', buffering=1)
+    textfile_path = metrics_textfile or None
+
+def add_listener(callback):
+    """
+    Calls callback(event) for every event from now on, from whichever thread emits it.
+    The callback must be quick and thread-safe, e.g. queue.Queue.put.
+    """
+    listeners.append(callback)
+
+def remove_listener(callback):
+    if callback in listeners:
+        listeners.remove(callback)
+
+class DownloadCancelled(Exception):
+    """
+    Raised inside a download once its cancel event is set.
+    """
+
+def check_cancelled():
+    """
+    Raises DownloadCancelled if the current download has been cancelled. Called at the
+    start of every stage and for every chunk that arrives, so a cancel takes effect quickly.
+    """
+    event = cancel_event.get()
+    if event is not None and event.is_set():
+        raise DownloadCancelled("The download was cancelled.")
+
+def count_stage_request():
+    """
+    Counts a request sent by the current thread; called by send_request.
+    """
+    thread_requests.count = getattr(thread_requests, 'count', 0) + 1
+
+def emit(event):
+    """
+    Stamps an event with the time and current card and sends it to the log and the listeners.
+    """
+    event.setdefault('time', time.time())
+    event.setdefault('card', current_card.get())
+    if event_log is not None:
+        line = json.dumps(event, default=str)
+        with event_log_lock:
+            if event_log is not None:
+                event_log.write(line + '\n')
+    for callback in list(listeners):
+        callback(event)
+
+def report_progress(byte_count):
+    """
+    Reports bytes as they arrive, for live throughput. Only listeners get these events;
+    they would swamp the event log.
+    """
+    check_cancelled()
+    if listeners:
+        event = {'event': 'progress', 'bytes': byte_count, 'card': current_card.get()}
+        for callback in list(listeners):
+            callback(event)
+
+class Stage:
+    """
+    Times one stage of a download (search, card PNG, gallery page, image, HTML, bundling)
+    and emits a 'stage' event with its wall time, bytes and requests when it ends.
+    Set bytes while the stage runs, and failed if it failed without raising.
+
+    Usage:
+        with Stage('card') as stage:
+            stage.bytes = save(...)
+    """
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.bytes = 0
+        self.failed = False
+
+    def __enter__(self):
+        check_cancelled()
+        self.requests_before = getattr(thread_requests, 'count', 0)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start_time
+        requests = getattr(thread_requests, 'count', 0) - self.requests_before
+        ok = exc_type is None and not self.failed
+        with totals_lock:
+            totals = stage_totals.setdefault(self.name, {'events': 0, 'seconds': 0.0, 'bytes': 0, 'requests': 0, 'failures': 0})
+            totals['events'] += 1
+            totals['seconds'] += seconds
+            totals['bytes'] += self.bytes
+            totals['requests'] += requests
+            totals['failures'] += 0 if ok else 1
+        emit(dict(self.fields, event='stage', stage=self.name, seconds=round(seconds, 6),
+                  bytes=self.bytes, requests=requests, ok=ok))
+        return False
+
+def write_textfile():
+    """
+    Writes the per-stage totals to the Prometheus textfile, if one is configured.
+    The file is replaced atomically so the collector never reads half of it.
+    """
+    if not textfile_path:
+        return
+    metrics = [
+        ('events', 'chub_stage_events_total', "Download stages completed."),
+        ('seconds', 'chub_stage_seconds_total', "Wall time spent in download stages."),
+        ('bytes', 'chub_stage_bytes_total', "Bytes downloaded or written by download stages."),
+        ('requests', 'chub_stage_requests_total', "HTTP requests sent by download stages, retries included."),
+        ('failures', 'chub_stage_failures_total', "Download stages that failed."),
+    ]
+    with totals_lock:
+        totals = {name: dict(values) for name, values in stage_totals.items()}
+    lines = []
+    for key, metric, help_text in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name in sorted(totals):
+            lines.append(f'{metric}{{stage="{name}"}} {totals[name][key]}')
+    temp_path = f"{textfile_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, textfile_path)
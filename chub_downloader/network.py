@@ -0,0 +1,234 @@
+import random
+import threading
+import time
+import urllib.parse
+
+from .config import config, default_settings, get_int_setting
+from .metrics import count_stage_request
+
+def create_session(pool_size):
+    """
+    Creates a requests session whose connection pool can serve pool_size
+    concurrent requests, so connections are reused instead of reopened.
+    """
+    # Imported here so importing the library doesn't pay for requests up front
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Shared HTTP session used for all API and gallery requests, created on first use
+http_session = None
+http_session_lock = threading.Lock()
+
+def get_http_session():
+    """
+    Returns the shared HTTP session. Its pool has one connection per gallery worker,
+    plus one for page requests made while the workers are busy, and at least as many
+    as the requests max_concurrent_requests lets run at once, so none is discarded.
+    """
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            http_session = create_session(max(get_int_setting('gallery_workers', minimum=1) + 1,
+                                              get_int_setting('max_concurrent_requests', minimum=1)))
+        return http_session
+
+# Retry and throttling settings for the shared request layer
+retry_base_delay = 0.5
+retry_max_delay = 60.0
+
+# Statuses that are worth retrying
+retry_statuses = {429, 500, 502, 503, 504}
+
+class AdaptiveLimiter:
+    """
+    Limits the number of concurrent requests to one host. The limit halves when the host
+    answers 429 and grows by one after a full limit's worth of successes in a row, so bulk
+    downloads settle at the highest rate the host tolerates. A Retry-After pauses every request.
+    """
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.active = 0
+        self.successes = 0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                elif self.active >= self.limit:
+                    self.condition.wait()
+                else:
+                    break
+            self.active += 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def record_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def record_throttle(self, retry_after=None):
+        with self.condition:
+            self.limit = max(1, self.limit // 2)
+            self.successes = 0
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+# Per-host limiters and request counters, reported at the end of a run
+host_limiters = {}
+host_stats = {}
+host_lock = threading.Lock()
+
+def get_host_limiter(host):
+    """
+    Returns the adaptive limiter of a host, creating it on first use.
+    """
+    with host_lock:
+        if host not in host_limiters:
+            host_limiters[host] = AdaptiveLimiter(get_int_setting('max_concurrent_requests', minimum=1))
+            host_stats[host] = {'requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0}
+        return host_limiters[host]
+
+def count_request(host, counter):
+    """
+    Increments one of a host's request counters.
+    """
+    with host_lock:
+        host_stats[host][counter] += 1
+
+def get_retry_after(response):
+    """
+    Returns the delay in seconds requested by a Retry-After header, or None.
+    """
+    retry_after = response.headers.get('Retry-After')
+    if not retry_after:
+        return None
+    try:
+        return min(retry_max_delay, max(0.0, float(retry_after)))
+    except ValueError:
+        pass
+    # Only HTTP-date values need the email parser, so it's imported on demand
+    import email.utils
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return min(retry_max_delay, max(0.0, retry_at.timestamp() - time.time()))
+
+def get_backoff_delay(attempt):
+    """
+    Returns the exponential backoff delay with full jitter for a retry attempt.
+    """
+    return random.uniform(0, min(retry_max_delay, retry_base_delay * 2 ** attempt))
+
+def send_request(method, url, **kwargs):
+    """
+    Sends a request through the shared session. Connection errors, 429 and 5xx responses are
+    retried (up to the max_retries setting) with exponential backoff and jitter, honoring Retry-After.
+    The host's adaptive limiter slot is held until the response is closed, so streamed
+    responses must be closed (e.g. used in a with block). The final response is returned
+    even if it is an error; callers decide whether to raise_for_status().
+    """
+    import requests
+
+    host = urllib.parse.urlsplit(url).hostname
+    limiter = get_host_limiter(host)
+    max_retries = get_int_setting('max_retries', minimum=0)
+    session = get_http_session()
+    attempt = 0
+    while True:
+        limiter.acquire()
+        count_request(host, 'requests')
+        count_stage_request()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            limiter.release()
+            if attempt >= max_retries:
+                count_request(host, 'failures')
+                raise
+            count_request(host, 'retries')
+            time.sleep(get_backoff_delay(attempt))
+            attempt += 1
+            continue
+        except BaseException:
+            limiter.release()
+            raise
+
+        if response.status_code in retry_statuses:
+            retry_after = get_retry_after(response)
+            if response.status_code == 429:
+                count_request(host, 'throttled')
+                limiter.record_throttle(retry_after)
+            if attempt < max_retries:
+                response.close()
+                limiter.release()
+                count_request(host, 'retries')
+                time.sleep(retry_after if retry_after is not None else get_backoff_delay(attempt))
+                attempt += 1
+                continue
+            count_request(host, 'failures')
+        else:
+            limiter.record_success()
+
+        # Release the slot once the body has been read
+        close_response = response.close
+        released = []
+        def close():
+            try:
+                close_response()
+            finally:
+                if not released:
+                    released.append(True)
+                    limiter.release()
+        response.close = close
+        if not kwargs.get('stream'):
+            response.close()
+        return response
+
+def format_request_stats():
+    """
+    Returns one line per host with its request, retry, throttle and failure counts.
+    """
+    with host_lock:
+        return [
+            f"{host}: {stats['requests']} requests, {stats['retries']} retries, "
+            f"{stats['throttled']} throttled, {stats['failures']} failures"
+            for host, stats in sorted(host_stats.items(), key=lambda item: str(item[0]))
+        ]
+
+def get_api_url(path):
+    """
+    Returns the URL of an API path on the configured API server (the api_base_url setting),
+    so a local stand-in server can be used for testing and benchmarks.
+    """
+    base_url = config['Settings'].get('api_base_url') or default_settings['api_base_url']
+    return base_url.rstrip('/') + path
+
+def get_api_headers(api_token):
+    """
+    Builds the headers used for Chub.ai API requests.
+    """
+    headers = {
+        'accept': 'application/json',
+        'User-Agent': 'ChubCardDownloader/1.0'
+    }
+    if api_token:
+        headers['Authorization'] = f'Bearer {api_token}'
+    return headers
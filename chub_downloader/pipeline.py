@@ -0,0 +1,592 @@
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .blobs import open_blob_store
+from .budget import check_free_space, get_transfer_budget
+from .bundle import manifest_file_name, open_card_writer, sanitize_filename
+from .cardpng import CardPngError, read_card_png, summarize_card
+from .config import get_bool_setting, get_int_setting
+from .index import get_index_path, index_card
+from .journal import get_resume_headers, open_journal, save_download
+from .metrics import Stage, current_card, emit, write_textfile
+from .network import get_api_headers, get_api_url, send_request
+from .report import generate_html, stylesheet_file_name, write_stylesheet
+from .search import search_cards
+from .versions import download_versions, version_index_file_name
+
+logger = logging.getLogger(__name__)
+
+# Number of gallery entries requested per page
+gallery_page_size = 24
+
+def new_result():
+    """
+    Returns an empty download result.
+    """
+    return {
+        'status': 'ok',
+        'reason': '',
+        'message': '',
+        'path': '',
+        'bytes': 0,
+        'gallery_count': 0,
+        'candidates': []
+    }
+
+def resolve_card(name, output_directory, api_token):
+    """
+    Finds the single card matching a name or fullPath.
+    Returns (node, None) on success, or (None, result) with a skipped result when
+    no card or several cards match (the matching nodes are in the result's 'candidates').
+    """
+    # A search recorded by an interrupted run doesn't have to be repeated
+    journal = open_journal(output_directory)
+    node = journal.searched_node(name)
+    if node is not None:
+        return node, None
+
+    result = new_result()
+    with Stage('search', card=name, query=name):
+        nodes = search_cards(name, api_token)
+
+    if len(nodes) > 1:
+        # A fullPath identifies a card exactly, even if the search matches others
+        exact_nodes = [node for node in nodes if node.get('fullPath', '').lower() == name.lower()]
+        if exact_nodes:
+            nodes = exact_nodes[:1]
+
+    if not nodes:
+        result['status'] = 'skipped'
+        result['reason'] = 'no_results'
+        result['message'] = "No card found with the given name."
+        if not api_token:
+            result['message'] += "\n\nIf you're searching for NSFL or private cards, you may need to set your Chub.ai token."
+        return None, result
+    elif len(nodes) > 1:
+        result['status'] = 'skipped'
+        result['reason'] = 'multiple_results'
+        result['message'] = "Multiple cards found. Please enter a more specific name or the card code."
+        result['candidates'] = nodes
+        return None, result
+
+    journal.record({'stage': 'searched', 'query': name, 'node': nodes[0]})
+    return nodes[0], None
+
+def download_card_pipeline(name, output_directory, bundle_option, api_token, max_gallery_images=0):
+    """
+    Runs the full download for one card: search, card PNG, gallery and bundling.
+    At most max_gallery_images gallery images are downloaded (0 means all).
+    Returns a result dict (see download_card_node). If several cards match, the result
+    is skipped with reason 'multiple_results' and the matching nodes in 'candidates'.
+    HTTP and file errors are raised.
+    """
+    node, result = resolve_card(name, output_directory, api_token)
+    if node is None:
+        return result
+    return download_card_node(node, output_directory, bundle_option, api_token, max_gallery_images)
+
+def download_card_node(node, output_directory, bundle_option, api_token, max_gallery_images=0):
+    """
+    Downloads the card described by a search node: card PNG, gallery and bundling.
+    Files recorded in the manifest of an earlier download are only fetched again if they changed,
+    and files completed by an interrupted attempt (see DownloadJournal) are not fetched again.
+    Returns a result dict with 'status' ('ok' or 'skipped'), 'reason', 'message',
+    'path', 'bytes' and 'gallery_count'. HTTP and file errors are raised.
+    Each stage emits a timing event (see metrics.Stage), and a 'done' event ends the card.
+    """
+    card_token = current_card.set(node['fullPath'])
+    start_time = time.perf_counter()
+    status = 'failed'
+    try:
+        result = download_card_files(node, output_directory, bundle_option, api_token, max_gallery_images)
+        status = result['status']
+        return result
+    finally:
+        emit({'event': 'done', 'status': status, 'seconds': round(time.perf_counter() - start_time, 6)})
+        current_card.reset(card_token)
+        try:
+            write_textfile()
+        except OSError as err:
+            # The metrics are a side channel; the card's own result or error goes through
+            logger.error(f"Failed to write the metrics textfile: {err}")
+
+def download_card_files(node, output_directory, bundle_option, api_token, max_gallery_images=0):
+    """
+    Does the work of download_card_node for the current card.
+    """
+    headers = get_api_headers(api_token)
+    result = new_result()
+
+    card_id = node['id']
+    full_path = node['fullPath']
+    name = node['name']
+
+    # Sanitize the name for use in file paths
+    sanitized_name = sanitize_filename(name)
+
+    # Create output directory
+    output_dir_path = output_directory
+    if not os.path.exists(output_dir_path):
+        os.makedirs(output_dir_path)
+
+    card_dir = os.path.join(output_dir_path, sanitized_name)
+    # A zip archive is rebuilt next to the old one, so both are on disk until it's replaced
+    zip_path = f"{card_dir}.zip"
+    check_free_space(output_dir_path, os.path.getsize(zip_path) if bundle_option == 'Zip' and os.path.exists(zip_path) else 0)
+    job = open_journal(output_directory).job(full_path)
+
+    # Files go straight into the card folder or the zip archive, depending on the bundle option
+    card_writer = open_card_writer(card_dir, bundle_option)
+    try:
+        # The manifest of an earlier download tells which files are still current
+        previous_manifest = card_writer.read_manifest() or {}
+        if previous_manifest.get('id') != card_id:
+            previous_manifest = {}
+
+        png_name = f"{sanitized_name}.png"
+        previous_card = previous_manifest.get('card', {})
+        journal_card = job.state()['card']
+        card_unchanged = (
+            node.get('lastActivityAt')
+            and previous_manifest.get('lastActivityAt') == node.get('lastActivityAt')
+            and previous_card.get('file') == png_name
+            and previous_card.get('sha256')
+            and card_writer.has_file(png_name)
+        )
+
+        with Stage('card') as card_stage:
+            if card_unchanged:
+                # The card has not been touched since the last download
+                card_writer.keep_file(png_name)
+                card_sha256 = previous_card['sha256']
+                card_summary = previous_card if 'definition_sha256' in previous_card else read_card_summary(card_writer, png_name)
+            elif card_writer.resumable and journal_card and journal_card['file'] == png_name and card_writer.has_file(png_name):
+                # Already downloaded by an interrupted attempt
+                card_sha256 = journal_card['sha256']
+                card_summary = journal_card if 'definition_sha256' in journal_card else read_card_summary(card_writer, png_name)
+            else:
+                # Second API call to download PNG
+                download_url = get_api_url("/api/characters/download")
+                payload = {
+                    "format": "card_spec_v2",
+                    "fullPath": full_path,
+                    "version": "main"
+                }
+
+                download_headers = headers.copy()
+                download_headers['accept'] = '*/*'
+                download_headers['Content-Type'] = 'application/json'
+                download_headers.update(get_resume_headers(card_writer, job, png_name))
+
+                # The PNG is only kept if its chunks and embedded card data check out
+                card_summary = {}
+                def check_card(source):
+                    card_summary.update(summarize_card(read_card_png(source)))
+
+                with get_transfer_budget().transfer() as transfer, \
+                        send_request('POST', download_url, headers=download_headers, json=payload, stream=True) as response:
+                    response.raise_for_status()
+                    transfer.reserve(response)
+
+                    # Save the PNG file directly without using PIL to preserve metadata
+                    import hashlib  # Loads OpenSSL, so it's imported on first download rather than at import
+                    digest = hashlib.sha256()
+                    card_stage.bytes = save_download(card_writer, job, png_name, response, digest, check_card)
+                    result['bytes'] += card_stage.bytes
+                    card_sha256 = digest.hexdigest()
+                if card_writer.resumable:
+                    job.record_card(dict(card_summary, file=png_name, sha256=card_sha256))
+
+        # Save description and additional information as HTML using markdown and a template
+        stylesheet_href = None
+        if get_bool_setting('shared_stylesheet'):
+            # The card folder (or the folder a zip is extracted to) sits in the output directory
+            write_stylesheet(output_directory)
+            stylesheet_href = f"../{stylesheet_file_name}"
+        with Stage('html') as html_stage:
+            html_content = generate_html(node, stylesheet_href, card_summary.get('fields'))
+            card_writer.write_text(f"{sanitized_name}_info.html", html_content)
+            html_stage.bytes = len(html_content)
+
+        # Earlier versions of the card, if the whole history is kept
+        version_entries = None
+        versions_changed = False
+        if get_bool_setting('download_versions'):
+            main_entry = {'file': png_name, 'sha256': card_sha256, 'definition_sha256': card_summary.get('definition_sha256')}
+            version_entries, version_bytes, versions_changed = download_versions(
+                card_id, full_path, card_writer, headers, main_entry, refresh=not card_unchanged
+            )
+            result['bytes'] += version_bytes
+
+        # Third API call(s) to get gallery images
+        blob_store = open_blob_store(output_directory) if get_bool_setting('deduplicate_gallery') else None
+        gallery_count, gallery_entries = download_gallery(
+            card_id, card_writer, headers, max_gallery_images, previous_manifest.get('gallery', {}), job, blob_store
+        )
+        result['gallery_count'] = gallery_count
+        result['bytes'] += sum(entry['bytes'] for entry in gallery_entries)
+
+        gallery_manifest = {}
+        for entry in gallery_entries:
+            gallery_manifest[entry['name']] = {
+                'url': entry['url'],
+                'etag': entry['etag'],
+                'last_modified': entry['last_modified']
+            }
+            if entry.get('sha256'):
+                # Deduplicated images are recognized by their content hash
+                gallery_manifest[entry['name']]['sha256'] = entry['sha256']
+        changed = (
+            not card_unchanged
+            or any(entry['changed'] for entry in gallery_entries)
+            or gallery_manifest != previous_manifest.get('gallery', {})
+            or versions_changed
+        )
+
+        with Stage('bundle'):
+            if changed:
+                manifest = {
+                    'id': card_id,
+                    'fullPath': full_path,
+                    'lastActivityAt': node.get('lastActivityAt'),
+                    'card': {
+                        'file': png_name,
+                        'sha256': card_sha256,
+                        'fields': card_summary.get('fields'),
+                        'definition_sha256': card_summary.get('definition_sha256')
+                    },
+                    'gallery': gallery_manifest,
+                    'node': node
+                }
+                if version_entries:
+                    card_writer.write_text(version_index_file_name, json.dumps({'fullPath': full_path, 'versions': version_entries}, indent=2))
+                # Written last, so it only ever describes files that are complete
+                card_writer.write_text(manifest_file_name, json.dumps(manifest, indent=2))
+                card_writer.close()
+            else:
+                # Nothing to update; an existing archive is left untouched
+                card_writer.discard()
+        job.finish()
+    except BaseException:
+        card_writer.discard()
+        raise
+
+    result['path'] = card_writer.path
+
+    # Keep the local card index up to date; a failure here doesn't fail the download
+    try:
+        index_card(get_index_path(output_directory), node, card_writer.path)
+    except sqlite3.Error as err:
+        logger.error(f"Failed to index card {full_path}: {err}")
+
+    if not changed:
+        result['status'] = 'skipped'
+        result['reason'] = 'unchanged'
+        result['message'] = f"Nothing has changed since the last download in {card_writer.path}"
+    elif bundle_option == 'Zip':
+        result['message'] = f"All files have been saved and zipped at {card_writer.path}"
+    else:
+        result['message'] = f"All files have been saved in {card_writer.path}"
+
+    return result
+
+def read_card_summary(card_writer, png_name):
+    """
+    Returns the report fields and definition hash of a card PNG kept from an earlier download
+    (see cardpng.summarize_card), for manifests written before they were recorded.
+    A damaged PNG is logged (see --verify) and gives an empty summary.
+    """
+    try:
+        return summarize_card(read_card_png(card_writer.file_source(png_name)))
+    except (CardPngError, OSError) as err:
+        logger.error(f"Could not read the card data of {png_name} in {card_writer.path}: {err}")
+        return {}
+
+def fetch_gallery_page(card_id, page, headers):
+    """
+    Fetches one page of a card's gallery listing.
+    """
+    gallery_url = get_api_url(f"/api/gallery/project/{card_id}?nsfw=true&page={page}&limit={gallery_page_size}")
+
+    with Stage('gallery_page', page=page) as page_stage:
+        response = send_request('GET', gallery_url, headers=headers)
+        response.raise_for_status()
+        page_stage.bytes = len(response.content)
+        return response.json()
+
+def download_gallery(card_id, card_writer, headers, max_images=0, previous_gallery=None, job=None, blob_store=None):
+    """
+    Downloads the images of every gallery page into the card folder or archive.
+    The next page is requested while the current page's images are still downloading.
+    previous_gallery is the gallery part of an earlier manifest, used for conditional requests,
+    and job is the card's journal entry, used to skip or resume images of an interrupted attempt.
+    With a blob_store, images are deduplicated across cards (see BlobStore).
+    Returns the gallery image count reported by the API and a list with one entry per saved image.
+    """
+    previous_gallery = previous_gallery or {}
+    journal_gallery = job.state()['gallery'] if job is not None and card_writer.resumable else {}
+    gallery_data = fetch_gallery_page(card_id, 1, headers)
+    gallery_count = gallery_data.get('count', 0)
+    wanted = min(gallery_count, max_images) if max_images > 0 else gallery_count
+    # The card's steps are now known: the HTML, the card PNG, each image and the bundling
+    emit({'event': 'plan', 'steps': wanted + 3})
+
+    def download_image(image_url):
+        with Stage('image', url=image_url) as image_stage:
+            entry = download_gallery_image(image_url, card_writer, previous_gallery, journal_gallery, job, blob_store)
+            image_stage.bytes = entry['bytes'] if entry else 0
+            image_stage.failed = entry is None
+        return entry
+
+    image_futures = []
+    # Download the gallery images concurrently over the shared session
+    with ThreadPoolExecutor(max_workers=get_int_setting('gallery_workers', minimum=1)) as executor:
+        page = 1
+        while len(image_futures) < wanted:
+            image_urls = [image_node['primary_image_path'] for image_node in gallery_data.get('nodes', [])]
+            if not image_urls:
+                break
+            for image_url in image_urls[:wanted - len(image_futures)]:
+                # Each image runs in a copy of this context, so its events know their card
+                image_futures.append(executor.submit(contextvars.copy_context().run, download_image, image_url))
+            if len(image_futures) >= wanted:
+                break
+            # Fetch the next page while this page's images are downloading
+            page += 1
+            gallery_data = fetch_gallery_page(card_id, page, headers)
+
+        gallery_entries = [future.result() for future in image_futures]
+
+    return gallery_count, [entry for entry in gallery_entries if entry is not None]
+
+def download_gallery_image(image_url, card_writer, previous_gallery, journal_gallery=None, job=None, blob_store=None):
+    """
+    Downloads a single gallery image into the card folder or archive.
+    An image already saved by an earlier download is only fetched again if it changed,
+    and one finished by an interrupted attempt is not fetched at all.
+    With a blob_store, an image URL that is already stored is linked in without a request,
+    and a new image is stored once and then linked in.
+    Returns the image's manifest entry with the bytes saved, or None if the download failed.
+    """
+    image_name = image_url.split('/')[-1]
+    sanitized_image_name = sanitize_filename(image_name)
+
+    journal_entry = (journal_gallery or {}).get(sanitized_image_name)
+    if journal_entry and journal_entry['url'] == image_url and card_writer.has_file(sanitized_image_name):
+        return dict(journal_entry, bytes=0)
+
+    previous_entry = previous_gallery.get(sanitized_image_name)
+    if blob_store is not None:
+        record = blob_store.lookup(image_url)
+        if record:
+            return link_gallery_image(sanitized_image_name, record, blob_store, card_writer, previous_entry, job, bytes_saved=0)
+
+    request_headers = {}
+    if previous_entry and previous_entry.get('url') == image_url and card_writer.has_file(sanitized_image_name):
+        if previous_entry.get('etag'):
+            request_headers['If-None-Match'] = previous_entry['etag']
+        if previous_entry.get('last_modified'):
+            request_headers['If-Modified-Since'] = previous_entry['last_modified']
+    conditional = bool(request_headers)
+    if job is not None and not conditional and blob_store is None:
+        request_headers.update(get_resume_headers(card_writer, job, sanitized_image_name))
+
+    # The file slot is taken before the request, so a full budget holds back new fetches
+    with get_transfer_budget().transfer() as transfer, \
+            send_request('GET', image_url, headers=request_headers, stream=True) as image_response:
+        if image_response.status_code == 304 and conditional:
+            card_writer.keep_file(sanitized_image_name)
+            return dict(previous_entry, name=sanitized_image_name, bytes=0, changed=False)
+        if image_response.status_code in (200, 206):
+            transfer.reserve(image_response)
+        if image_response.status_code == 200 and blob_store is not None:
+            record, image_bytes = blob_store.store_response(image_url, image_response)
+            return link_gallery_image(sanitized_image_name, record, blob_store, card_writer, previous_entry, job, image_bytes)
+        if image_response.status_code in (200, 206):
+            if job is not None:
+                image_bytes = save_download(card_writer, job, sanitized_image_name, image_response)
+            else:
+                image_bytes = card_writer.write_response(sanitized_image_name, image_response)
+            entry = {
+                'name': sanitized_image_name,
+                'url': image_url,
+                'etag': image_response.headers.get('ETag'),
+                'last_modified': image_response.headers.get('Last-Modified'),
+                'changed': True
+            }
+            if job is not None and card_writer.resumable:
+                job.record_gallery_item(entry)
+            return dict(entry, bytes=image_bytes)
+    logger.error(f"Failed to download gallery image: {image_url}")
+    return None
+
+def link_gallery_image(image_name, record, blob_store, card_writer, previous_entry, job, bytes_saved):
+    """
+    Links a stored gallery image into the card folder or archive, unless the card already
+    has the same image from an earlier download. Returns the image's manifest entry.
+    """
+    entry = {
+        'name': image_name,
+        'url': record['url'],
+        'etag': record['etag'],
+        'last_modified': record['last_modified'],
+        'sha256': record['sha256'],
+        'changed': True
+    }
+    if (previous_entry and previous_entry.get('url') == record['url']
+            and previous_entry.get('sha256') == record['sha256'] and card_writer.has_file(image_name)):
+        card_writer.keep_file(image_name)
+        entry['changed'] = False
+    else:
+        card_writer.write_file(image_name, blob_store.blob_path(record['sha256']))
+    if job is not None and card_writer.resumable:
+        job.record_gallery_item(entry)
+    return dict(entry, bytes=bytes_saved)
+
+class DownloadEngine:
+    """
+    Downloads many cards as a staged asyncio pipeline: while earlier cards' PNGs and
+    galleries are downloading, later names are already being searched. Each stage has
+    its own concurrency limit, and the blocking stage work runs in a thread pool.
+    The on-disk output is the same as download_card_pipeline's.
+
+    Usage:
+        engine = DownloadEngine(output_directory, 'Folder', api_token)
+        async for name, result, seconds in engine.run(names):
+            ...
+    """
+    def __init__(self, output_directory, bundle_option, api_token, max_gallery_images=0,
+                 search_concurrency=4, download_concurrency=4):
+        self.output_directory = output_directory
+        self.bundle_option = bundle_option
+        self.api_token = api_token
+        self.max_gallery_images = max_gallery_images
+        self.search_concurrency = max(1, search_concurrency)
+        self.download_concurrency = max(1, download_concurrency)
+
+    async def run(self, names):
+        """
+        Downloads every card in names (any iterable of names, fullPaths or search nodes) and
+        yields (name, result, seconds) as each card finishes, in completion order; a search
+        node's name is its fullPath. The iterable is read lazily, only as fast as the cards
+        are downloaded. A failed card yields a result with status 'failed' and the error in 'message'.
+        """
+        # Imported here so importing the library doesn't pay for asyncio up front
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.search_concurrency + self.download_concurrency)
+        # Bounded queues keep the searches only a little ahead of the downloads
+        search_queue = asyncio.Queue(maxsize=self.search_concurrency * 2)
+        download_queue = asyncio.Queue(maxsize=self.download_concurrency * 2)
+        result_queue = asyncio.Queue()
+        in_progress = set()
+        names = iter(names)
+
+        def failed_result(err):
+            result = new_result()
+            result['status'] = 'failed'
+            result['reason'] = 'error'
+            result['message'] = str(err)
+            return result
+
+        async def feed():
+            while True:
+                # Reading the list may block (e.g. on stdin or a search page), so it runs in the pool too
+                try:
+                    name = await loop.run_in_executor(executor, next, names, None)
+                except Exception as err:
+                    # The list itself failed, e.g. a search page that couldn't be read
+                    logger.error(f"Failed to read the card list: {err}")
+                    await result_queue.put(('', failed_result(err), 0.0))
+                    break
+                if name is None:
+                    break
+                await search_queue.put((name, time.perf_counter()))
+
+        async def search_worker():
+            while True:
+                item = await search_queue.get()
+                if item is None:
+                    break
+                name, start_time = item
+                # Whatever goes wrong with one card becomes its result, so the worker carries on
+                try:
+                    if isinstance(name, dict):
+                        # A search node (e.g. from iter_search_results) needs no search of its own
+                        node, result = name, None
+                        name = node['fullPath']
+                    else:
+                        node, result = await loop.run_in_executor(
+                            executor, resolve_card, name, self.output_directory, self.api_token
+                        )
+                    if node is not None and node['fullPath'] in in_progress:
+                        # Two names for the same card would write the same files
+                        node, result = None, new_result()
+                        result['status'] = 'skipped'
+                        result['reason'] = 'duplicate'
+                        result['message'] = "The same card is already being downloaded."
+                except Exception as err:
+                    logger.error(f"Failed to download card {name}: {err}")
+                    node, result = None, failed_result(err)
+                    if not isinstance(name, str):
+                        name = ''
+                if node is None:
+                    await result_queue.put((name, result, time.perf_counter() - start_time))
+                else:
+                    in_progress.add(node['fullPath'])
+                    await download_queue.put((name, node, start_time))
+
+        async def download_worker():
+            while True:
+                item = await download_queue.get()
+                if item is None:
+                    break
+                name, node, start_time = item
+                try:
+                    result = await loop.run_in_executor(
+                        executor, download_card_node, node, self.output_directory,
+                        self.bundle_option, self.api_token, self.max_gallery_images
+                    )
+                except Exception as err:
+                    logger.error(f"Failed to download card {name}: {err}")
+                    result = failed_result(err)
+                finally:
+                    in_progress.discard(node['fullPath'])
+                await result_queue.put((name, result, time.perf_counter() - start_time))
+
+        async def run_stages():
+            search_workers = [asyncio.create_task(search_worker()) for _ in range(self.search_concurrency)]
+            download_workers = [asyncio.create_task(download_worker()) for _ in range(self.download_concurrency)]
+            try:
+                await feed()
+                for _ in range(self.search_concurrency):
+                    await search_queue.put(None)
+                await asyncio.gather(*search_workers)
+                for _ in range(self.download_concurrency):
+                    await download_queue.put(None)
+                await asyncio.gather(*download_workers)
+            finally:
+                # Workers left over by an unexpected error would wait forever
+                for task in search_workers + download_workers:
+                    task.cancel()
+                # Always ends the results, so run() can't hang; awaiting the stages re-raises the error
+                await result_queue.put(None)
+
+        stages = asyncio.create_task(run_stages())
+        try:
+            while True:
+                item = await result_queue.get()
+                if item is None:
+                    break
+                yield item
+            await stages
+        finally:
+            if not stages.done():
+                stages.cancel()
+            executor.shutdown(wait=False)
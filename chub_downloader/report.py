@@ -0,0 +1,306 @@
+import json
+import os
+import re
+import threading
+import urllib.parse
+
+# Define the highlight color
+highlight_color = '#859412'
+
+def parse_token_counts(node):
+    """
+    Returns the token counts stored in the node's TOKEN_COUNTS label, or an empty dict.
+    """
+    for label in node.get('labels', []):
+        if label.get('title') == 'TOKEN_COUNTS':
+            try:
+                return json.loads(label.get('description', '{}'))
+            except json.JSONDecodeError:
+                pass  # Ignore if JSON is invalid
+            break  # Only the first TOKEN_COUNTS label is used
+    return {}
+
+# Name of the stylesheet shared by the reports in an output directory
+stylesheet_file_name = 'chub_report.css'
+
+# Stylesheet of the HTML reports, inlined in each report unless a shared one is linked
+report_stylesheet = """
+body {
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    margin: 0;
+    padding: 0;
+    background-color: #f4f4f4;
+}
+.container {
+    max-width: 1200px;
+    margin: 40px auto;
+    background-color: #fff;
+    padding: 30px;
+    box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+    border-radius: 8px;
+}
+h1 {
+    text-align: center;
+    margin-bottom: 20px;
+    color: HIGHLIGHT;
+}
+.avatar {
+    display: block;
+    margin-left: auto;
+    margin-right: auto;
+    width: 200px;
+    height: 200px;
+    border-radius: 50%;
+    object-fit: cover;
+    box-shadow: 0 2px 5px rgba(0,0,0,0.2);
+}
+.description, .info, .token-counts, .card-definition {
+    margin-top: 30px;
+}
+.description h2, .info h2, .token-counts h2, .card-definition h2 {
+    border-bottom: 2px solid #e7e7e7;
+    padding-bottom: 10px;
+    color: HIGHLIGHT;
+}
+.description p {
+    line-height: 1.8;
+    color: #555;
+}
+.info ul, .token-counts ul, .card-definition ul {
+    list-style-type: none;
+    padding: 0;
+    display: grid;
+    grid-template-columns: 1fr;
+    gap: 10px;
+}
+.info ul li, .token-counts ul li, .card-definition ul li {
+    background: #fafafa;
+    padding: 12px 15px;
+    border-radius: 5px;
+    display: flex;
+    flex-direction: column;
+    word-wrap: break-word;
+}
+.token-counts ul li {
+    background: #eaf8fc;
+}
+.info ul li strong, .card-definition ul li strong {
+    color: #333;
+    margin-bottom: 5px;
+}
+footer {
+    text-align: center;
+    margin-top: 40px;
+    color: #aaa;
+}
+@media (min-width: 500px) {
+    .info ul, .token-counts ul, .card-definition ul {
+        grid-template-columns: 1fr 1fr;
+    }
+}
+@media (min-width: 800px) {
+    .info ul, .token-counts ul, .card-definition ul {
+        grid-template-columns: 1fr 1fr 1fr;
+    }
+}
+""".replace('HIGHLIGHT', highlight_color)
+
+# Report templates, filled in with str.format; every value is escaped before it's inserted
+report_template = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{name} - Card Information</title>
+    {style}
+</head>
+<body>
+    <div class="container">
+        <h1>{name}</h1>
+        <img src="{avatar_url}" alt="Avatar" class="avatar">
+        <div class="description">
+            <h2>Description</h2>
+            {description}
+        </div>
+        <div class="info">
+            <h2>Card Information</h2>
+            <ul>
+{info_items}
+            </ul>
+        </div>
+{token_counts}
+{card_definition}
+    </div>
+    <footer>
+        Generated by Chub.ai Card Downloader
+    </footer>
+</body>
+</html>
+"""
+inline_style_template = '<style>{stylesheet}</style>'
+linked_style_template = '<link rel="stylesheet" href="{href}">'
+item_template = """                <li>
+                    <strong>{key}:</strong>
+                    <span>{value}</span>
+                </li>"""
+token_counts_template = """        <div class="token-counts">
+            <h2>Token Counts</h2>
+            <ul>
+{items}
+            </ul>
+        </div>"""
+card_definition_template = """        <div class="card-definition">
+            <h2>Card Definition</h2>
+            <ul>
+{items}
+            </ul>
+        </div>"""
+
+# URL schemes a report may link to; anything else (javascript:, data:, ...) is dropped
+safe_url_schemes = ('http', 'https', 'mailto')
+
+def get_url_scheme(url):
+    """
+    Returns the lowercase scheme of a URL, or '' for a relative one. Whitespace and control
+    characters are left out, as browsers leave them out, so they can't hide a scheme.
+    """
+    return urllib.parse.urlsplit(re.sub(r'[\x00-\x20]', '', url or '')).scheme.lower()
+
+def is_safe_url(url):
+    """
+    Returns True if a link or image URL in a report is relative or uses a safe scheme.
+    """
+    scheme = get_url_scheme(url)
+    return not scheme or scheme in safe_url_schemes
+
+def create_markdown_converter():
+    """
+    Returns a Markdown converter for card text, which anyone can write: raw HTML is
+    escaped like any other text, and links and images with unsafe URLs lose them.
+    """
+    # Imported here so importing the library doesn't pay for markdown up front
+    import markdown  # For markdown conversion
+    from markdown.treeprocessors import Treeprocessor
+
+    class DropUnsafeUrls(Treeprocessor):
+        def run(self, root):
+            for element in root.iter():
+                for attribute in ('href', 'src'):
+                    if attribute in element.attrib and not is_safe_url(element.get(attribute)):
+                        del element.attrib[attribute]
+
+    converter = markdown.Markdown()
+    converter.preprocessors.deregister('html_block')
+    converter.inlinePatterns.deregister('html')
+    # Runs after the inline patterns have created the links and images
+    converter.treeprocessors.register(DropUnsafeUrls(converter), 'drop_unsafe_urls', 0)
+    return converter
+
+# Each thread keeps one Markdown converter and resets it between cards instead of building a new one
+markdown_converters = threading.local()
+
+def convert_markdown(text):
+    """
+    Converts markdown text to HTML with this thread's reusable converter (see create_markdown_converter).
+    """
+    converter = getattr(markdown_converters, 'converter', None)
+    if converter is None:
+        converter = markdown_converters.converter = create_markdown_converter()
+    return converter.reset().convert(text)
+
+# Stylesheets already written by this process, so each output directory is checked only once
+written_stylesheets = set()
+
+def write_stylesheet(output_directory):
+    """
+    Writes the shared report stylesheet into output_directory unless it's already current,
+    and returns its path.
+    """
+    stylesheet_path = os.path.join(output_directory, stylesheet_file_name)
+    if stylesheet_path in written_stylesheets:
+        return stylesheet_path
+    try:
+        with open(stylesheet_path, encoding='utf-8') as file:
+            if file.read() == report_stylesheet:
+                written_stylesheets.add(stylesheet_path)
+                return stylesheet_path
+    except FileNotFoundError:
+        pass
+    os.makedirs(output_directory, exist_ok=True)
+    # Write to a temp file first so concurrent downloads never link a half-written stylesheet
+    temp_path = f"{stylesheet_path}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(report_stylesheet)
+    os.replace(temp_path, stylesheet_path)
+    written_stylesheets.add(stylesheet_path)
+    return stylesheet_path
+
+def generate_html(node, stylesheet_href=None, card_fields=None):
+    """
+    Generates an HTML file with card information and description.
+    If stylesheet_href is given the report links that stylesheet (see write_stylesheet)
+    instead of embedding its own copy. card_fields (see cardpng.get_card_fields) adds
+    a section with what the card PNG itself says.
+    """
+    # Imported here so importing the library doesn't pay for html.entities up front
+    from html import escape
+
+    # Convert markdown description to HTML
+    description_html = convert_markdown(node.get('description') or '')
+
+    # Prepare fields with friendly labels
+    fields = {
+        'ID': node.get('id', ''),
+        'Full Path': node.get('fullPath', ''),
+        'Downloads': node.get('starCount', ''),
+        'Last Activity': node.get('lastActivityAt', ''),
+        'Created At': node.get('createdAt', ''),
+        'Tags': ', '.join(node.get('topics') or []),
+        'Forks': node.get('forksCount', ''),
+        'Rating': node.get('rating', ''),
+        'Rating Count': node.get('ratingCount', ''),
+        'Tagline': node.get('tagline', ''),
+        'Chats': node.get('nChats', ''),
+        'Messages': node.get('nMessages', ''),
+        'Public Chats': node.get('n_public_chats', ''),
+        'Favorites': node.get('n_favorites', ''),
+    }
+    info_items = '\n'.join(
+        item_template.format(key=key, value=escape('' if value is None else str(value)))
+        for key, value in fields.items()
+    )
+
+    # Parse TOKEN_COUNTS, leaving out the total and empty counts
+    token_items = [
+        item_template.format(key=escape(key.replace('_', ' ').title()), value=escape(str(value)))
+        for key, value in parse_token_counts(node).items()
+        if value != 0 and key != 'total'
+    ]
+    token_counts = token_counts_template.format(items='\n'.join(token_items)) if token_items else ''
+
+    # Fields read from the card PNG's embedded definition, leaving out empty ones
+    card_items = [
+        item_template.format(key=escape(key), value=escape(str(value)))
+        for key, value in (card_fields or {}).items()
+        if value not in ('', None)
+    ]
+    card_definition = card_definition_template.format(items='\n'.join(card_items)) if card_items else ''
+
+    # The avatar is loaded by the browser, so only web URLs are used
+    avatar_url = str(node.get('avatar_url') or '')
+    if get_url_scheme(avatar_url) not in ('http', 'https'):
+        avatar_url = ''
+
+    if stylesheet_href:
+        style = linked_style_template.format(href=escape(stylesheet_href))
+    else:
+        style = inline_style_template.format(stylesheet=report_stylesheet)
+
+    return report_template.format(
+        name=escape(str(node.get('name') or '')),
+        style=style,
+        avatar_url=escape(avatar_url),
+        description=description_html,
+        info_items=info_items,
+        token_counts=token_counts,
+        card_definition=card_definition,
+    )
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from .config import get_int_setting
+from .metrics import Stage
+from .network import get_api_headers, get_api_url, send_request
+
+class SearchCache:
+    """
+    Keeps recent search results in memory, keyed by query and token.
+    Entries expire after ttl seconds and the least recently used entry is evicted first.
+    A refined query (one with every word of an earlier, complete query, plus more) is
+    answered by filtering the earlier result instead of calling the API again.
+    """
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, query, api_token):
+        query = ' '.join(query.lower().split())
+        now = time.monotonic()
+        with self.lock:
+            # Drop expired entries
+            for key in [key for key, entry in self.entries.items() if entry['expires'] <= now]:
+                del self.entries[key]
+
+            entry = self.entries.get((query, api_token))
+            if entry is not None:
+                self.entries.move_to_end((query, api_token))
+                return entry['nodes']
+
+            # Whole words only: the API doesn't match 'ann' inside 'joanna'
+            words = set(query.split())
+            for (cached_query, cached_token), entry in reversed(self.entries.items()):
+                if cached_token == api_token and entry['complete'] and set(cached_query.split()) <= words:
+                    self.entries.move_to_end((cached_query, cached_token))
+                    return [node for node in entry['nodes'] if node_matches_query(node, query)]
+        return None
+
+    def put(self, query, api_token, nodes, complete):
+        if self.max_entries <= 0:
+            return
+        query = ' '.join(query.lower().split())
+        with self.lock:
+            self.entries[(query, api_token)] = {
+                'nodes': nodes,
+                'complete': complete,
+                'expires': time.monotonic() + self.ttl
+            }
+            self.entries.move_to_end((query, api_token))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+def node_matches_query(node, query):
+    """
+    Returns True if every word of the query appears in the node's name, fullPath, tagline, description or tags.
+    """
+    searchable = ' '.join([
+        node.get('name') or '',
+        node.get('fullPath') or '',
+        node.get('tagline') or '',
+        node.get('description') or '',
+        ' '.join(node.get('topics') or [])
+    ]).lower()
+    return all(word in searchable for word in query.split())
+
+# Recent search results, so repeated and refined lookups don't hit the API; created on first use
+search_cache = None
+search_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """
+    Returns the shared search cache, sized by the search_cache_size and search_cache_ttl settings.
+    """
+    global search_cache
+    with search_cache_lock:
+        if search_cache is None:
+            search_cache = SearchCache(
+                max_entries=get_int_setting('search_cache_size'),
+                ttl=get_int_setting('search_cache_ttl')
+            )
+        return search_cache
+
+def search_cards(name, api_token):
+    """
+    Returns the search nodes matching name, served from the search cache when possible.
+    """
+    search_cache = get_search_cache()
+    nodes = search_cache.get(name, api_token)
+    if nodes is not None:
+        return nodes
+
+    # First API call: Search for the card
+    parameters = {
+        'search': name,
+        'nsfw': 'true',
+        'nsfl': 'true',
+        'first': 100,
+        'page': 1,
+        'sort': 'created_at',
+        'asc': 'false'
+    }
+    search_url = get_api_url(f"/api/characters/search?{urlencode(parameters)}")
+
+    response = send_request('GET', search_url, headers=get_api_headers(api_token))
+    response.raise_for_status()
+
+    data = response.json()
+
+    nodes = data.get('nodes', [])
+    # Only a result that holds every match can answer refined searches locally
+    complete = data.get('count', 0) <= len(nodes)
+    search_cache.put(name, api_token, nodes, complete)
+    return nodes
+
+# Number of search results requested per page while mirroring
+mirror_page_size = 100
+
+def iter_search_results(query='', api_token='', tags=(), creator=None, nsfw=True, nsfl=True,
+                        min_rating=None, max_cards=0, sort='created_at', page_size=mirror_page_size):
+    """
+    Yields every search node matching a query, tag list and/or creator, newest first by sort,
+    reading the result pages (of page_size nodes) one at a time as the nodes are consumed,
+    so only one page is held in memory and a consumer that stops early requests no more pages.
+    Nodes below min_rating are left out, and at most max_cards nodes are yielded (0 means all).
+    Results aren't cached: a mirror reads each page once.
+    """
+    # Card ids already yielded; cards created during the run push older ones onto the
+    # next page, and those must not be downloaded twice
+    seen_ids = set()
+    yielded = 0
+    page = 1
+    while True:
+        parameters = {
+            'search': query,
+            'nsfw': 'true' if nsfw else 'false',
+            'nsfl': 'true' if nsfl else 'false',
+            'first': page_size,
+            'page': page,
+            'sort': sort,
+            'asc': 'false'
+        }
+        if tags:
+            parameters['topics'] = ','.join(tags)
+        if creator:
+            parameters['username'] = creator
+        search_url = get_api_url(f"/api/characters/search?{urlencode(parameters)}")
+        with Stage('search', query=query, page=page) as search_stage:
+            response = send_request('GET', search_url, headers=get_api_headers(api_token))
+            response.raise_for_status()
+            search_stage.bytes = len(response.content)
+            data = response.json()
+
+        nodes = data.get('nodes', [])
+        for node in nodes:
+            if node.get('id') in seen_ids:
+                continue
+            seen_ids.add(node.get('id'))
+            # The server may ignore the creator filter; the fullPath starts with the creator's name
+            if creator and not (node.get('fullPath') or '').lower().startswith(creator.lower() + '/'):
+                continue
+            if min_rating is not None and (node.get('rating') or 0) < min_rating:
+                continue
+            yield node
+            yielded += 1
+            if max_cards and yielded >= max_cards:
+                return
+
+        if len(nodes) < page_size or page * page_size >= data.get('count', 0):
+            return
+        page += 1
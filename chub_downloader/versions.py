@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+
+from .budget import get_transfer_budget
+from .bundle import sanitize_filename
+from .cardpng import read_card_png, summarize_card
+from .metrics import DownloadCancelled, Stage
+from .network import get_api_url, send_request
+
+logger = logging.getLogger(__name__)
+
+# Per-card index of the card's versions, next to the manifest
+version_index_file_name = 'versions.json'
+
+# Folder in the card folder or archive holding the PNGs of earlier versions
+version_folder_name = 'versions'
+
+# Number of versions requested per page
+version_page_size = 100
+
+class DuplicateVersion(Exception):
+    """
+    Raised while a version downloads if its PNG or card definition is already stored,
+    so the download is dropped instead of kept.
+    """
+    def __init__(self, match, sha256, definition_sha256, size):
+        super().__init__(f"Same as version {match['version']}")
+        self.match = match
+        self.sha256 = sha256
+        self.definition_sha256 = definition_sha256
+        self.size = size
+
+def fetch_card_versions(card_id, headers):
+    """
+    Returns every version of a card, newest first, as dicts with 'version' (the commit id
+    the download API accepts), 'created_at' and 'message'. Chub keeps a card's history as
+    the commits of its project.
+    """
+    versions = []
+    page = 1
+    while True:
+        versions_url = get_api_url(f"/api/v4/projects/{card_id}/repository/commits?per_page={version_page_size}&page={page}")
+        with Stage('version_list', page=page) as list_stage:
+            response = send_request('GET', versions_url, headers=headers)
+            response.raise_for_status()
+            list_stage.bytes = len(response.content)
+            commits = response.json()
+        for commit in commits:
+            versions.append({
+                'version': commit['id'],
+                'created_at': commit.get('created_at') or commit.get('committed_date'),
+                'message': (commit.get('title') or commit.get('message') or '').strip()
+            })
+        if len(commits) < version_page_size:
+            return versions
+        page += 1
+
+def read_version_index(card_writer):
+    """
+    Returns the version entries stored with a card by an earlier download, or an empty list.
+    """
+    try:
+        text = card_writer.read_text(version_index_file_name)
+        return json.loads(text)['versions'] if text else []
+    except (OSError, json.JSONDecodeError, KeyError, TypeError) as err:
+        logger.error(f"Ignoring unreadable version index in {card_writer.path}: {err}")
+        return []
+
+def download_versions(card_id, full_path, card_writer, headers, main_entry, refresh=True):
+    """
+    Stores every version of a card in the versions folder of its card folder or archive.
+    A version whose PNG bytes or card definition match the main card or a version already
+    stored gets an index entry pointing at that file ('same_as') instead of a file of its own,
+    so the history only costs the versions that actually changed. Versions in the index of
+    an earlier download aren't fetched again, and ones the server no longer lists stay in it;
+    without refresh the version list isn't even requested. A version that fails to download
+    is logged and skipped (keeping its earlier entry, if any), so it doesn't fail the card. main_entry describes the main card PNG ('file', 'sha256', 'definition_sha256').
+    Returns the version entries, newest first, the bytes downloaded and whether the index changed.
+    """
+    previous_entries = read_version_index(card_writer)
+    if not refresh and previous_entries:
+        for entry in previous_entries:
+            # An entry kept after a failed download may have no file
+            if 'same_as' not in entry and card_writer.has_file(entry['file']):
+                card_writer.keep_file(entry['file'])
+        return previous_entries, 0, False
+
+    try:
+        versions = fetch_card_versions(card_id, headers)
+    except Exception as err:
+        # The main card is already saved; the history is tried again on the next download
+        logger.error(f"Failed to list the versions of {full_path}: {err}")
+        return previous_entries, 0, False
+
+    main_entry = dict(main_entry, version='main')
+    previous_by_version = {entry['version']: entry for entry in previous_entries}
+    # Files already stored, by PNG hash and by definition hash
+    stored = {main_entry['sha256']: main_entry}
+    if main_entry.get('definition_sha256'):
+        stored[main_entry['definition_sha256']] = main_entry
+
+    def reusable(entry):
+        if entry is None:
+            return False
+        same_as = entry.get('same_as')
+        if same_as == 'main':
+            # Only while the main card still holds that content
+            return entry['sha256'] == main_entry['sha256'] or entry['definition_sha256'] == main_entry.get('definition_sha256')
+        if same_as is not None:
+            return reusable(previous_by_version.get(same_as))
+        return card_writer.has_file(entry['file'])
+
+    # Keep the stored files first, so new downloads can be matched against them
+    for entry in previous_entries:
+        if 'same_as' not in entry and reusable(entry):
+            card_writer.keep_file(entry['file'])
+            stored.setdefault(entry['sha256'], entry)
+            stored.setdefault(entry['definition_sha256'], entry)
+
+    entries = []
+    downloaded = 0
+    for version in versions:
+        entry = previous_by_version.get(version['version'])
+        if reusable(entry):
+            entries.append(entry)
+            continue
+        try:
+            with Stage('version', version=version['version']) as version_stage:
+                new_entry, size = download_version(full_path, version, card_writer, headers, stored)
+                version_stage.bytes = size
+        except DownloadCancelled:
+            raise
+        except Exception as err:
+            # The main card is already saved; the version is tried again the next time the card changes
+            logger.error(f"Failed to download version {version['version']} of {full_path}: {err}")
+            if entry is not None:
+                entries.append(entry)
+            continue
+        entry = new_entry
+        downloaded += size
+        if 'same_as' not in entry:
+            stored.setdefault(entry['sha256'], entry)
+            stored.setdefault(entry['definition_sha256'], entry)
+        entries.append(entry)
+
+    # Versions the server no longer lists keep their files, so they keep their entries too
+    listed = {version['version'] for version in versions}
+    entries.extend(entry for entry in previous_entries if entry['version'] not in listed and reusable(entry))
+
+    return entries, downloaded, entries != previous_entries
+
+def download_version(full_path, version, card_writer, headers, stored):
+    """
+    Downloads one version's PNG and stores it unless stored (files by PNG and definition hash)
+    already has it. Returns the version's index entry and the bytes downloaded.
+    """
+    import hashlib  # Loads OpenSSL, so it's imported on first download rather than at import
+
+    file_name = f"{version_folder_name}/{sanitize_filename(version['version'])}.png"
+    payload = {
+        "format": "card_spec_v2",
+        "fullPath": full_path,
+        "version": version['version']
+    }
+    download_headers = headers.copy()
+    download_headers['accept'] = '*/*'
+    download_headers['Content-Type'] = 'application/json'
+    digest = hashlib.sha256()
+    summary = {}
+
+    def check_version(source):
+        summary.update(summarize_card(read_card_png(source)))
+        sha256 = digest.hexdigest()
+        match = stored.get(sha256) or stored.get(summary['definition_sha256'])
+        if match is not None:
+            if isinstance(source, str):
+                size = os.path.getsize(source)
+            else:
+                size = source.seek(0, os.SEEK_END)
+                source.seek(0)
+            raise DuplicateVersion(match, sha256, summary['definition_sha256'], size)
+
+    entry = dict(version)
+    try:
+        with get_transfer_budget().transfer() as transfer, \
+                send_request('POST', get_api_url("/api/characters/download"), headers=download_headers,
+                             json=payload, stream=True) as response:
+            response.raise_for_status()
+            transfer.reserve(response)
+            size = card_writer.write_response(file_name, response, digest, check=check_version)
+    except DuplicateVersion as duplicate:
+        entry.update(file=duplicate.match['file'], same_as=duplicate.match['version'],
+                     sha256=duplicate.sha256, definition_sha256=duplicate.definition_sha256)
+        return entry, duplicate.size
+    entry.update(file=file_name, sha256=digest.hexdigest(), definition_sha256=summary['definition_sha256'])
+    return entry, size
@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import re
+
+from .config import config
+from .metrics import thread_requests
+from .search import iter_search_results
+
+logger = logging.getLogger(__name__)
+
+# Where the watch keeps its high-water marks and unfinished cards, in the output directory
+watch_state_file_name = 'watch_state.json'
+
+# Search results requested per poll page; a quiet source needs a single small page
+watch_page_size = 20
+
+# Search orders polled for every source, with the node field each sorts on:
+# new cards surface by creation date, edited ones by their last activity
+watch_feeds = {'created_at': 'createdAt', 'last_activity_at': 'lastActivityAt'}
+
+def split_setting_list(value):
+    """
+    Returns the entries of a list setting, separated by commas or new lines.
+    """
+    return [entry.strip() for entry in re.split(r'[,\n]', value or '') if entry.strip()]
+
+def get_watch_sources():
+    """
+    Returns the sources to watch from the watch_creators, watch_tags and watch_queries settings,
+    as dicts with 'key' (how the source's marks are stored), 'creator', 'tags' and 'query'.
+    """
+    settings = config['Settings']
+    sources = []
+    for creator in split_setting_list(settings.get('watch_creators')):
+        sources.append({'key': f"creator:{creator.lower()}", 'creator': creator, 'tags': (), 'query': ''})
+    for tag in split_setting_list(settings.get('watch_tags')):
+        sources.append({'key': f"tag:{tag.lower()}", 'creator': None, 'tags': (tag,), 'query': ''})
+    for query in split_setting_list(settings.get('watch_queries')):
+        sources.append({'key': f"query:{query.lower()}", 'creator': None, 'tags': (), 'query': query})
+    return sources
+
+def load_watch_state(output_directory):
+    """
+    Returns the watch state saved in the output directory: 'marks' (per source and feed,
+    the newest timestamp seen and the ids of the cards with it) and 'pending' (search nodes
+    by fullPath that were found but not downloaded yet).
+    """
+    state_path = os.path.join(output_directory, watch_state_file_name)
+    state = {'marks': {}, 'pending': {}}
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, encoding='utf-8') as f:
+                state.update(json.load(f))
+        except (OSError, json.JSONDecodeError) as err:
+            # Starting over only means the next poll sets new marks
+            logger.error(f"Ignoring unreadable watch state {state_path}: {err}")
+    return state
+
+def save_watch_state(output_directory, state):
+    """
+    Saves the watch state atomically, so an interrupted write never loses the marks.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    state_path = os.path.join(output_directory, watch_state_file_name)
+    with open(f"{state_path}.part", 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{state_path}.part", state_path)
+
+def poll_feed(source, sort, field, mark, api_token):
+    """
+    Reads one source's search results, newest first by sort, up to its high-water mark.
+    Returns the nodes above the mark and the new mark. Without a mark (the source's first
+    poll) nothing is returned: the mark is set at the newest card, and later polls find
+    what appears after it. Use --mirror for the cards a source already has.
+    """
+    nodes = []
+    first_mark = None
+    results = iter_search_results(source['query'], api_token, tags=source['tags'], creator=source['creator'],
+                                  sort=sort, page_size=watch_page_size)
+    try:
+        for node in results:
+            stamp = node.get(field) or ''
+            if mark is None:
+                # First poll: only the newest cards are read, to mark them
+                if first_mark is not None and stamp != first_mark['time']:
+                    break
+                first_mark = first_mark or {'time': stamp, 'ids': []}
+                first_mark['ids'].append(node.get('id'))
+            elif stamp < mark['time']:
+                break
+            elif stamp > mark['time'] or node.get('id') not in mark['ids']:
+                # Cards sharing the marked timestamp may still be new
+                nodes.append(node)
+    finally:
+        # Stops the paging
+        results.close()
+
+    if mark is None:
+        # A source without cards yet gets an empty mark, so its first card counts as new
+        return nodes, first_mark or {'time': '', 'ids': []}
+    if not nodes:
+        return nodes, mark
+    newest_time = max(node.get(field) or '' for node in nodes)
+    newest_ids = [node.get('id') for node in nodes if (node.get(field) or '') == newest_time]
+    if newest_time == mark['time']:
+        newest_ids = mark['ids'] + newest_ids
+    return nodes, {'time': newest_time, 'ids': newest_ids}
+
+def poll_watch_sources(sources, state, api_token):
+    """
+    Polls every source's feeds once, moving their marks in state, and adds the new and
+    updated cards to state['pending']. A source that fails keeps its marks and is polled
+    again next time. Returns the number of new cards, the number of requests sent and
+    the errors, one line per failed feed.
+    """
+    requests_before = getattr(thread_requests, 'count', 0)
+    found = 0
+    errors = []
+    for source in sources:
+        source_marks = state['marks'].setdefault(source['key'], {})
+        for sort, field in watch_feeds.items():
+            try:
+                nodes, source_marks[sort] = poll_feed(source, sort, field, source_marks.get(sort), api_token)
+            except Exception as err:
+                logger.error(f"Failed to poll {source['key']} by {sort}: {err}")
+                errors.append(f"{source['key']} ({sort}): {err}")
+                continue
+            for node in nodes:
+                if node['fullPath'] not in state['pending']:
+                    found += 1
+                state['pending'][node['fullPath']] = node
+    return found, getattr(thread_requests, 'count', 0) - requests_before, errors